@@ -1,34 +1,72 @@
+# Muss vor allen anderen Imports passieren: requests, pymysql, redis und
+# threading werden dadurch grün und blockieren den Event-Loop nicht mehr.
+import eventlet
+eventlet.monkey_patch()
+
 import os
 import requests
-import json
+import time
 from flask import (
     Flask, render_template, redirect, url_for,
-    request, session, flash, jsonify, abort
+    request, session, flash, jsonify, abort, Response
 )
 from flask_socketio import SocketIO
+from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.security import generate_password_hash
 from auth import (
-    check_login, login_user, logout_user,
-    login_required, admin_required
+    LOGIN_THROTTLE, check_login, login_user, logout_user,
+    login_required, admin_required,
+    bound_sockets, socket_identity, unbind_socket, user_room
+)
+from chat import (
+    BROADCAST, handle_chat_messages, history_before, reset_chat_history,
+    warm_chat_history
 )
-from chat import handle_chat_messages
-from models import db, User, Message, StreamKey, Setting
-from smilies import handle_smilie_upload, delete_smilie, get_all_smilies
-from configparser import ConfigParser
-from urllib.parse import quote_plus
-from utils import validate_hls_token, generate_hls_token, clear_hls_secret_cache
+from models import db, User, Message, StreamKey
+from smilies import handle_smilie_upload, delete_smilie, get_all_smilies, SMILIE_CATALOG
+from urllib.parse import quote_plus, urlsplit, parse_qs
+from sqlalchemy import or_
+from utils import validate_hls_token, generate_hls_token
+from settings import SETTINGS
 from datetime import date, datetime, timedelta
 from shop import shop_bp
 from lang  import init_i18n
+from write_behind import MessageWriter
+from user_cache import USER_CACHE
+from presence import PRESENCE
+from stream_state import STREAM
+from stream_keys import STREAM_KEYS, hash_stream_key
+from notifier import NOTIFIER
+from outbound import OUTBOUND
+from chat_archive import ChatArchiver
+from watch_bonus import WatchBonus, stream_bonus_due
+from ledger import LEDGER
+from migrations import ensure_indexes, migrate_inventory, migrate_stream_keys
+from cluster import CLUSTER, create_store
+from concurrency import BLOCKING, WATCHDOG, PoolBusy
+from hls_cache import SegmentCache, UpstreamClient, TokenDecisions, PASS_REQUEST_HEADERS
+import atexit
+import signal
+import sys
 
 
 CFG_PATH = "config/config.cfg"
-config = ConfigParser(interpolation=None)
-config.read(CFG_PATH)
+SETTINGS.load(CFG_PATH)
 
 def _get_cfg(section, key, default=None):
-    return (config[section].get(key, default)
-            if config.has_section(section) else default)
+    return SETTINGS.cfg(section, key, default)
+
+def _get_cfg_int(section, key, default: int) -> int:
+    try:
+        return int(_get_cfg(section, key, default))
+    except (TypeError, ValueError):
+        return default
+
+def _get_cfg_bool(section, key, default: bool = False) -> bool:
+    value = (_get_cfg(section, key) or "").strip().lower()
+    if not value:
+        return default
+    return value in ("1", "true", "yes", "on")
 
 db_user  = _get_cfg("database", "user")
 db_pass  = quote_plus(_get_cfg("database", "password", ""))
@@ -43,8 +81,32 @@ admin_color = _get_cfg("admin", "color") or "#000000"
 discord_webhook = _get_cfg("discord", "webhook")
 
 stream_base_url = _get_cfg("stream", "base_url", "http://localhost:8090")
+# proxy = über /proxy/hls, nginx = Segmente direkt von nginx (auth_request,
+# Opt-in über nginx/hls_auth.conf.example)
+hls_delivery    = (_get_cfg("stream", "delivery", "proxy") or "proxy").strip().lower()
+hls_token_ttl   = _get_cfg_int("stream", "token_ttl", 60)
+# so lange bleibt ein rotierter Key gültig – mindestens eine Token-Laufzeit
+hls_key_grace   = max(_get_cfg_int("stream", "key_grace", 300), hls_token_ttl)
+
+hls_upstream = UpstreamClient(
+    stream_base_url,
+    pool_size=_get_cfg_int("stream", "upstream_pool_size", 32),
+    connect_timeout=_get_cfg_int("stream", "upstream_connect_timeout", 3),
+    read_timeout=_get_cfg_int("stream", "upstream_read_timeout", 10)
+)
+hls_cache = SegmentCache(
+    hls_upstream,
+    max_bytes=_get_cfg_int("stream", "segment_cache_mb", 64) * 1024 * 1024,
+    playlist_ttl=_get_cfg_int("stream", "hls_fragment", 2)
+)
+hls_auth = TokenDecisions(
+    validate_hls_token,
+    max_size=_get_cfg_int("stream", "auth_cache_size", 10000),
+    deny_ttl=_get_cfg_int("stream", "auth_deny_ttl", 10)
+)
 
 app = Flask(__name__, template_folder="templates", static_folder="static")
+SETTINGS.init_app(app)
 app.secret_key = os.getenv("SECRET_KEY", "supersecretkey")
 
 init_i18n(app)
@@ -60,66 +122,165 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
 }
 
 db.init_app(app)
-socketio = SocketIO(app, cors_allowed_origins="*")
-handle_chat_messages(socketio)
+# Scale-out: mehrere Worker (serve.py) hinter Sticky Sessions teilen sich
+# Presence/Events über den Store und Socket.IO-Emits über die Message-Queue.
+CLUSTER.store        = create_store(_get_cfg("cluster", "presence_store", "local"))
+CLUSTER.worker_index = int(os.getenv("WORKER_INDEX", "0"))
+CLUSTER.worker_count = int(os.getenv("WORKER_COUNT", "1"))
+
+socketio = SocketIO(
+    app,
+    cors_allowed_origins="*",
+    message_queue=_get_cfg("cluster", "message_queue") or None
+)
+CLUSTER.start(socketio)
+
+OUTBOUND.max_bytes    = _get_cfg_int("runtime", "send_queue_kb", 512) * 1024
+OUTBOUND.max_messages = _get_cfg_int("runtime", "send_queue_messages", 500)
+OUTBOUND.slow_timeout = _get_cfg_int("runtime", "slow_client_timeout", 15)
+OUTBOUND.install(socketio)
+
+message_writer = MessageWriter(
+    app,
+    write_behind=_get_cfg_bool("chat", "write_behind"),
+    interval=_get_cfg_int("chat", "flush_interval_ms", 250) / 1000,
+    batch_size=_get_cfg_int("chat", "flush_batch", 200),
+    store=CLUSTER.store
+)
+message_writer.queue.max_queue = _get_cfg_int("chat", "flush_queue_limit", 100000)
+message_writer.start(socketio)
+
+USER_CACHE.max_size = _get_cfg_int("cache", "user_cache_size", 1000)
+
+BLOCKING.resize(_get_cfg_int("runtime", "blocking_pool_size", 4),
+                _get_cfg_int("runtime", "blocking_queue", 64))
+WATCHDOG.threshold = _get_cfg_int("runtime", "stall_threshold_ms", 250) / 1000
+LOGIN_THROTTLE.ip_limit    = _get_cfg_int("runtime", "login_ip_limit", 20)
+LOGIN_THROTTLE.ip_window   = _get_cfg_int("runtime", "login_ip_window", 60)
+LOGIN_THROTTLE.user_limit  = _get_cfg_int("runtime", "login_user_failures", 5)
+LOGIN_THROTTLE.user_window = _get_cfg_int("runtime", "login_user_window", 300)
+
+# Hinter nginx (web.conf) sonst überall 127.0.0.1 als Client-IP
+_proxy_count = _get_cfg_int("runtime", "proxy_count", 0)
+if _proxy_count > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=_proxy_count, x_proto=_proxy_count)
+
+atexit.register(message_writer.close)
+BROADCAST.tick      = _get_cfg_int("chat", "batch_tick_ms", 75) / 1000
+BROADCAST.threshold = _get_cfg_int("chat", "batch_threshold", 20)
+handle_chat_messages(socketio, message_writer)
+
+def _on_chat_clear(payload: dict) -> None:
+    """Ein anderer Worker hat den Chat geleert – eigene Reste hinterher."""
+    if payload.get("last_id") is not None:
+        message_writer.discard(upto=payload["last_id"])
+
+CLUSTER.subscribe("chat_clear", _on_chat_clear)
 
 app.register_blueprint(shop_bp)
 
-ONLINE_USERS: set[str] = set()
-SID_MAP: dict[str, str]  = {}
+PRESENCE.tick = _get_cfg_int("chat", "presence_tick_ms", 250) / 1000
+PRESENCE.ttl  = _get_cfg_int("cluster", "presence_ttl", 30)
+PRESENCE.start(socketio)
+
+_upstream_token = {"params": None, "renew_at": 0.0}
+
+def _upstream_params() -> dict:
+    """Token für Upstream-Requests (Proxy, Cache, Watcher). Erneuert nach
+    halber Laufzeit – nginx cached seine auth_request-Entscheidung pro Token."""
+    now = time.monotonic()
+    if _upstream_token["params"] is None or now >= _upstream_token["renew_at"]:
+        with app.app_context():
+            _upstream_token["params"] = {
+                "user": "hls-upstream",
+                "token": generate_hls_token("hls-upstream", expires_in=hls_token_ttl)}
+        _upstream_token["renew_at"] = now + hls_token_ttl / 2
+    return _upstream_token["params"]
+
+def _on_settings(snap) -> None:
+    STREAM.playlist = f"{snap.stream_suffix or 'whazzaStream'}.m3u8"
+    hls_auth.clear()
+    _upstream_token["params"] = None
+
+SETTINGS.on_change(_on_settings)
+
+hls_upstream.sign  = _upstream_params
+STREAM.client      = hls_upstream
+STREAM.interval    = _get_cfg_int("stream", "watch_interval", 5)
+STREAM.stale_after = _get_cfg_int("stream", "stale_after", 10)
+STREAM.start(socketio, watch=CLUSTER.worker_index == 0)
+
+NOTIFIER.path = _get_cfg("discord", "queue_path", "notify_queue.db")
+NOTIFIER.max_attempts = _get_cfg_int("discord", "max_attempts", 8)
+NOTIFIER.start(socketio, dispatch=CLUSTER.worker_index == 0)
+
+STREAM_KEYS.init_app(app)
+STREAM_KEYS.refresh_interval = _get_cfg_int("stream", "key_refresh", 60)
+STREAM_KEYS.limit  = _get_cfg_int("stream", "publish_limit", 10)
+STREAM_KEYS.window = _get_cfg_int("stream", "publish_window", 60)
+
+LEDGER.init_app(app,
+                interval=_get_cfg_int("points", "flush_interval_ms", 500) / 1000,
+                batch_size=_get_cfg_int("points", "flush_batch", 500))
+LEDGER.reconcile_interval = _get_cfg_int("points", "reconcile_interval", 3600)
+LEDGER.queue.max_queue = _get_cfg_int("points", "flush_queue_limit", 100000)
+LEDGER.start(socketio, reconcile=CLUSTER.worker_index == 0)
+atexit.register(LEDGER.close)
+
+watch_bonus = WatchBonus(app, tick=_get_cfg_int("stream", "bonus_tick", 30))
+chat_archiver = ChatArchiver(app,
+                             directory=_get_cfg("chat", "archive_dir", "archive"),
+                             chunk=_get_cfg_int("chat", "archive_chunk", 1000),
+                             interval=_get_cfg_int("chat", "archive_interval", 300))
+if CLUSTER.worker_index == 0:
+    watch_bonus.start(socketio)
+    chat_archiver.start(socketio)
 
 app.jinja_env.globals["datetime"] = datetime
 
-def send_user_list():
-    users = User.query.order_by(User.username).all()
-    socketio.emit(
-        "online_users",
-        [
-            {"username": u.username, "online": u.username in ONLINE_USERS, "color": u.color}
-            for u in users
-        ]
-    )
-
 @app.route("/api/online_users")
 def api_online_users():
-    users = User.query.order_by(User.username).all()
-    return jsonify([
-        {"username": u.username, "color": u.color}
-        for u in users if u.username in ONLINE_USERS
-    ])
+    return jsonify(PRESENCE.snapshot())
 
 @socketio.on("user_online")
-def user_online(data):
-    username = data.get("username")
-    if username:
-        ONLINE_USERS.add(username)
-        SID_MAP[request.sid] = username
-        send_user_list()
+def user_online(_data=None):
+    identity = socket_identity()
+    if identity:
+        user = USER_CACHE.get(identity.username)
+        PRESENCE.join(request.sid, identity.username, user.color if user else "#000000")
+        socketio.emit("stream_state", STREAM.snapshot(), to=request.sid)
+
+@socketio.on("hls_token")
+def refresh_hls_token():
+    """Token-Erneuerung über den offenen Socket statt Seiten-Reload (Antwort per Ack)."""
+    identity = socket_identity()
+    if not identity:
+        return None
+    return {"token": generate_hls_token(identity.username, expires_in=hls_token_ttl),
+            "ttl": hls_token_ttl}
 
 @socketio.on("disconnect")
 def user_left():
-    username = SID_MAP.pop(request.sid, None)
-    if username:
-        ONLINE_USERS.discard(username)
-        send_user_list()
+    PRESENCE.leave(request.sid)
+    unbind_socket(request.sid)
 
 def get_current_user():
-    uname = session.get("username")
-    return User.query.filter_by(username=uname).first() if uname else None
+    return USER_CACHE.get(session.get("username"))
 
 def send_discord_embed(text: str, color: int = 0xFF0000) -> None:
-    config.read(CFG_PATH)
-    webhook    = _get_cfg("discord", "webhook")
-    bot_name   = _get_cfg("discord", "username", "WhazzaStream Bot")
-    avatar_url = _get_cfg("discord", "avatar_url", "")
-    if not webhook:
-        raise RuntimeError("DISCORD_WEBHOOK nicht gesetzt")
-    payload = {
-        "username": bot_name,
-        "avatar_url": avatar_url,
-        "embeds": [{"description": text, "color": color}]
-    }
-    requests.post(webhook, json=payload, timeout=5).raise_for_status()
+    """Reiht das Embed ein – gesendet wird im Hintergrund (notifier.py)."""
+    NOTIFIER.notify(text, color)
+
+def _notify_stream(live: bool, _key_hash) -> None:
+    cfg = SETTINGS.current
+    if not _get_cfg_bool("discord", "notify_stream") or not NOTIFIER.webhook():
+        return
+    if live:
+        NOTIFIER.notify(cfg.cfg("discord", "live_text") or "🔴 Der Stream ist live!", 0x2ECC71)
+    else:
+        NOTIFIER.notify(cfg.cfg("discord", "offline_text") or "Der Stream ist beendet.", 0x95A5A6)
+
+STREAM.on_change(_notify_stream)
 
 def _require_json(req):
     try:
@@ -127,25 +288,21 @@ def _require_json(req):
     except Exception:
         return {}
 
-def sanitize_config(path: str = CFG_PATH) -> None:
-    cfg = ConfigParser(interpolation=None)
-    cfg.read(path)
-    if cfg.has_section("admin"):
-        cfg.remove_section("admin")
-        with open(path, "w") as fh:
-            cfg.write(fh)
-
-def is_valid_stream_key(key: str) -> bool:
-    return StreamKey.query.filter_by(key=key).first() is not None
+def sanitize_config() -> None:
+    SETTINGS.remove_config_section("admin")
 
 @app.route("/rtmp/auth", methods=["GET", "POST"])
 def rtmp_auth():
-    if is_valid_stream_key(request.values.get("name", "").strip()):
+    name = request.values.get("name", "").strip()
+    # nginx-rtmp schickt die Adresse des Encoders als "addr"
+    if STREAM_KEYS.check(name, request.values.get("addr") or request.remote_addr or "-"):
+        STREAM.on_publish(name)
         return "OK", 200
     abort(403)
 
 @app.route("/rtmp/done", methods=["GET", "POST"])
 def rtmp_done():
+    STREAM.on_done(request.values.get("name", "").strip())
     return "", 204
 
 @app.route("/")
@@ -158,25 +315,40 @@ def login():
         username = request.form["username"].strip()
         password = request.form["password"]
 
+        # vor jedem Hashing: Versuche pro IP, Fehlversuche pro User
+        wait = LOGIN_THROTTLE.retry_after(request.remote_addr or "-", username)
+        if wait:
+            flash(f"Zu viele Login-Versuche – bitte in {wait} s erneut versuchen.", "error")
+            return render_template("login.html"), 429
+
         user = User.query.filter_by(username=username).first()
 
         if user and not user.is_active:
             flash("Account gesperrt – bitte an den Admin wenden.", "error")
             return render_template("login.html")
 
-        if check_login(username, password):
-            login_user(session, username)
+        try:
+            ok = check_login(user, password)
+        except PoolBusy:
+            flash("Server ausgelastet – bitte gleich nochmal versuchen.", "error")
+            return render_template("login.html"), 503
+
+        if not ok:
+            LOGIN_THROTTLE.failed(username)
+        else:
+            LOGIN_THROTTLE.succeeded(username)
+            login_user(session, user)
             current_year=datetime.utcnow().year
             today   = date.today()
-            setting = Setting.query.first()
-            daily_bonus = (
-                setting.daily_bonus if setting and setting.daily_bonus is not None else 20
-            )
-
-            if user and user.last_daily_bonus != today:
-                user.points += daily_bonus
-                user.last_daily_bonus = today
-                db.session.commit()
+            daily_bonus = SETTINGS.current.daily_bonus
+
+            # Bedingung im UPDATE: parallele Logins zahlen den Bonus nur einmal
+            if user and user.last_daily_bonus != today and LEDGER.apply(
+                username, daily_bonus, "daily",
+                where=(or_(User.last_daily_bonus.is_(None),
+                           User.last_daily_bonus != today),),
+                last_daily_bonus=today
+            ):
                 flash(f"Tagesbonus: +{daily_bonus} Münzen", "success")
 
             return redirect(url_for("stream"))
@@ -204,9 +376,9 @@ def stream():
 
     total_tokens = sum(user.effect_inventory.values()) if user else 0
 
-    setting = Setting.query.first() or Setting()
+    setting = SETTINGS.current
     suffix  = setting.stream_suffix or "whazzaStream"
-    token   = generate_hls_token(session["username"], expires_in=60)
+    token   = generate_hls_token(session["username"], expires_in=hls_token_ttl)
 
     return render_template(
         "stream.html",
@@ -216,7 +388,8 @@ def stream():
         effect_tokens   = total_tokens,
         stream_suffix   = suffix,
         access_token    = token,
-        stream_base_url = stream_base_url,
+        token_ttl       = hls_token_ttl,
+        hls_src         = hls_playlist_url(suffix),
         bonus_interval  = setting.stream_bonus_interval or 30,
         bonus_points    = setting.stream_bonus_points  or 20,
 	    user_font       = user.font or "",
@@ -225,30 +398,31 @@ def stream():
     )
 
 def is_stream_live() -> bool:
-
-    return True
+    return STREAM.live
 
 @app.route("/api/stream_heartbeat", methods=["POST"])
 @login_required
 def stream_heartbeat():
+    """Optional – den Bonus bucht normalerweise ``watch_bonus`` für alle Online-User."""
     user = get_current_user()
 
     if not is_stream_live():
         return jsonify(success=False, message="Stream nicht live"), 400
 
-    setting  = Setting.query.first()
-    interval = setting.stream_bonus_interval if setting else 30
-    bonus    = setting.stream_bonus_points  if setting else 20
-
-    now = datetime.utcnow()
-
-    if (not user.last_stream_bonus or
-        (now - user.last_stream_bonus) >= timedelta(minutes=interval)):
+    setting  = SETTINGS.current
+    interval = setting.stream_bonus_interval
+    bonus    = setting.stream_bonus_points
 
-        user.points += bonus
-        user.last_stream_bonus = now
-        db.session.commit()
+    now    = datetime.utcnow().replace(microsecond=0)
+    cutoff = now - timedelta(minutes=interval)
 
+    credited = LEDGER.apply(
+        user.username, bonus, "stream",
+        where=(stream_bonus_due(cutoff),),
+        last_stream_bonus=now
+    )
+    if credited:
+        user = credited
         return jsonify(
             success=True,
             message=f"+{bonus} Münzen fürs Zuschauen",
@@ -264,21 +438,19 @@ def stream_heartbeat():
 @app.route("/admin")
 @admin_required
 def admin_panel():
-    config.read(CFG_PATH)
-    
-    setting = Setting.query.first() or Setting()
+    setting = SETTINGS.current
 
     return render_template(
         "admin.html",
         users=User.query.order_by(User.username).all(),
-        online=ONLINE_USERS,
+        online=PRESENCE.usernames(),
         smilies=get_all_smilies(),
         stream_keys=StreamKey.query.order_by(StreamKey.key).all(),
         stream_suffix=setting.stream_suffix,
         smilie_cost=setting.smilie_cost or 50,
-        current_webhook=_get_cfg("discord", "webhook", ""),
-        current_botname=_get_cfg("discord", "username", "WhazzaStream Bot"),
-        current_avatar=_get_cfg("discord", "avatar_url", ""),
+        current_webhook=setting.cfg("discord", "webhook", ""),
+        current_botname=setting.cfg("discord", "username", "WhazzaStream Bot"),
+        current_avatar=setting.cfg("discord", "avatar_url", ""),
         setting=setting
     )
 
@@ -288,16 +460,21 @@ def create_user():
     username = request.form["username"].strip()
     if User.query.filter_by(username=username).first():
         flash("Benutzername existiert bereits!", "error")
-    else:
-        db.session.add(User(
-            username=username,
-            password=generate_password_hash(request.form["password"]),
-            is_admin="is_admin" in request.form,
-            is_active=True,
-            color=request.form.get("color", "#000000")
-        ))
-        db.session.commit()
-        flash("Benutzer erfolgreich angelegt", "success")
+        return redirect(url_for("admin_panel"))
+    try:
+        password = BLOCKING.run(generate_password_hash, request.form["password"])
+    except PoolBusy:
+        flash("Server ausgelastet – bitte gleich nochmal versuchen.", "error")
+        return redirect(url_for("admin_panel"))
+    db.session.add(User(
+        username=username,
+        password=password,
+        is_admin="is_admin" in request.form,
+        is_active=True,
+        color=request.form.get("color", "#000000")
+    ))
+    db.session.commit()
+    flash("Benutzer erfolgreich angelegt", "success")
     return redirect(url_for("admin_panel"))
 
 @app.route("/admin/delete_user/<username>")
@@ -307,6 +484,7 @@ def delete_user(username):
     if user and not user.is_admin:
         db.session.delete(user)
         db.session.commit()
+        USER_CACHE.invalidate(username)
         flash("Benutzer gelöscht", "success")
     return redirect(url_for("admin_panel"))
 
@@ -317,8 +495,12 @@ def change_pw(username):
     new_pw = data.get("new_pw", "").strip()
     user = User.query.filter_by(username=username).first()
     if user and new_pw:
-        user.password = generate_password_hash(new_pw)
+        try:
+            user.password = BLOCKING.run(generate_password_hash, new_pw)
+        except PoolBusy:
+            return jsonify({"error": "Server ausgelastet"}), 503
         db.session.commit()
+        USER_CACHE.invalidate(username)
         return "", 204
     return jsonify({"error": "Bad request"}), 400
 
@@ -333,23 +515,65 @@ def toggle_user(username):
         return jsonify({"error": "not found"}), 404
     user.is_active = bool(state)
     db.session.commit()
-    if not user.is_active and username in ONLINE_USERS:
-        ONLINE_USERS.discard(username)
-        for sid, u in list(SID_MAP.items()):
-            if u == username:
-                socketio.emit("force_logout", to=sid)
-                SID_MAP.pop(sid, None)
-        send_user_list()
+    USER_CACHE.invalidate(username)
+    if not user.is_active:
+        socketio.emit("force_logout", to=user_room(username))
+        # sids aller Worker aus dem Presence-Store; fremde trennt die Message-Queue
+        for sid in PRESENCE.drop_user(username):
+            socketio.server.disconnect(sid, namespace="/")
     return "", 204
 
 @app.route("/admin/clear_chat", methods=["POST"])
 @admin_required
 def clear_chat():
-    Message.query.delete()
-    db.session.commit()
+    upto = message_writer.boundary()
+    message_writer.discard()
+    reset_chat_history(last_id=chat_archiver.clear(floor=upto))
     flash("Chatverlauf gelöscht", "success")
     return redirect(url_for("admin_panel"))
 
+@app.route("/admin/update_chat_retention", methods=["POST"])
+@admin_required
+def update_chat_retention():
+    try:
+        days = int(request.form.get("retention_days") or 0)
+        rows = int(request.form.get("retention_rows") or 0)
+        if days < 0 or rows < 0:
+            raise ValueError
+    except ValueError:
+        flash("Ungültige Eingabewerte", "error")
+        return redirect(url_for("admin_panel"))
+
+    SETTINGS.update_config("chat", retention_days=str(days), retention_rows=str(rows))
+    flash("Aufbewahrung gespeichert ✔ – ältere Nachrichten werden archiviert", "success")
+    return redirect(url_for("admin_panel"))
+
+@app.route("/admin/metrics")
+@admin_required
+def admin_metrics():
+    return jsonify(
+        chat_writer=message_writer.stats(),
+        chat_broadcast=BROADCAST.stats(),
+        send_queues=OUTBOUND.stats(),
+        user_cache=USER_CACHE.stats(),
+        presence=PRESENCE.stats(),
+        sockets=bound_sockets(),
+        cluster=CLUSTER.stats(),
+        blocking_pool=BLOCKING.stats(),
+        login_throttle=LOGIN_THROTTLE.stats(),
+        event_loop=WATCHDOG.stats(),
+        hls_cache=hls_cache.stats(),
+        hls_upstream=hls_upstream.stats(),
+        hls_auth=hls_auth.stats(),
+        stream=STREAM.stats(),
+        stream_keys=STREAM_KEYS.stats(),
+        discord=NOTIFIER.stats(),
+        chat_archive=chat_archiver.stats(),
+        watch_bonus=watch_bonus.stats(),
+        points_ledger=LEDGER.stats(),
+        settings=SETTINGS.stats()
+    )
+
 @app.route("/admin/send_discord", methods=["POST"])
 @admin_required
 def admin_send_discord():
@@ -357,7 +581,7 @@ def admin_send_discord():
     if text:
         try:
             send_discord_embed(text)
-            flash("Nachricht an Discord gesendet ✔", "success")
+            flash("Nachricht an Discord eingereiht ✔", "success")
         except Exception as e:
             flash(f"Discord-Fehler: {e}", "error")
     return redirect(url_for("admin_panel"))
@@ -386,13 +610,10 @@ def update_smilie_cost():
         flash("Ungültige Eingabewerte", "error")
         return redirect(url_for("admin_panel"))
 
-    setting = Setting.query.first() or Setting()
-    setting.smilie_cost = new_cost
-    setting.daily_bonus = daily_bonus
-    setting.stream_bonus_points = stream_bonus
-    setting.stream_bonus_interval = interval
-    db.session.add(setting)
-    db.session.commit()
+    SETTINGS.update(smilie_cost=new_cost,
+                    daily_bonus=daily_bonus,
+                    stream_bonus_points=stream_bonus,
+                    stream_bonus_interval=interval)
     flash("Belohnungseinstellungen gespeichert ✔", "success")
     return redirect(url_for("admin_panel"))
 
@@ -408,23 +629,8 @@ def update_smilie_prices():
         flash('Keine gültigen Preise übertragen', 'warning')
         return redirect(url_for('admin_panel'))
 
-    json_path = os.path.join(app.static_folder, 'smilies.json')
     try:
-        data = {}
-        if os.path.exists(json_path):
-            with open(json_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-
-        smilies = data.get('smilies', {})
-        if isinstance(smilies, list):
-            smilies = {n: 50 for n in smilies}
-
-        smilies.update(updates)
-        data['smilies'] = smilies
-
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
-
+        SMILIE_CATALOG.update(updates, default_price=50)
         flash('Smilie-Preise gespeichert ✔', 'success')
 
     except Exception as e:
@@ -439,12 +645,16 @@ def add_stream_key():
     new_key = request.form.get("stream_key", "").strip()
     if not new_key:
         flash("Kein Key übermittelt", "error")
-    elif StreamKey.query.filter_by(key=new_key).first():
+    elif StreamKey.query.filter_by(key=hash_stream_key(new_key)).first():
         flash("Dieser Stream-Key existiert bereits", "warning")
     else:
-        db.session.add(StreamKey(key=new_key))
+        sk = StreamKey(key=hash_stream_key(new_key))
+        db.session.add(sk)
         db.session.commit()
-        flash(f"Neuer Stream-Key „{new_key}“ angelegt", "success")
+        STREAM_KEYS.added(sk.key)
+        # Nur gehasht gespeichert – der Klartext ist hier zum letzten Mal sichtbar
+        flash(f"Neuer Stream-Key „{new_key}“ angelegt ({sk.fingerprint}) – "
+              "jetzt notieren, er wird nicht mehr angezeigt", "success")
     return redirect(url_for("admin_panel"))
 
 @app.route("/admin/delete_stream_key/<int:key_id>")
@@ -454,7 +664,8 @@ def delete_stream_key(key_id):
     if sk:
         db.session.delete(sk)
         db.session.commit()
-        flash(f"Stream-Key „{sk.key}“ gelöscht", "success")
+        STREAM_KEYS.removed(sk.key)
+        flash(f"Stream-Key {sk.fingerprint} gelöscht", "success")
     else:
         flash("Stream-Key nicht gefunden", "error")
     return redirect(url_for("admin_panel"))
@@ -464,10 +675,7 @@ def delete_stream_key(key_id):
 def update_stream_suffix():
     new_suffix = request.form.get("stream_suffix", "").strip()
     if new_suffix:
-        setting = Setting.query.first() or Setting()
-        setting.stream_suffix = new_suffix
-        db.session.add(setting)
-        db.session.commit()
+        SETTINGS.update(stream_suffix=new_suffix)
         flash("Stream-Endung aktualisiert ✔", "success")
     else:
         flash("Keine gültige Endung eingegeben!", "error")
@@ -480,15 +688,10 @@ def update_discord_webhook():
     new_botname = request.form.get("webhook_username", "").strip()
     new_avatar  = request.form.get("webhook_avatar", "").strip()
     if new_webhook:
-        cfg = ConfigParser(interpolation=None)
-        cfg.read(CFG_PATH)
-        if not cfg.has_section("discord"):
-            cfg.add_section("discord")
-        cfg.set("discord", "webhook", new_webhook)
-        cfg.set("discord", "username", new_botname or "WhazzaStream Bot")
-        cfg.set("discord", "avatar_url", new_avatar)
-        with open(CFG_PATH, "w") as f:
-            cfg.write(f)
+        SETTINGS.update_config("discord",
+                               webhook=new_webhook,
+                               username=new_botname or "WhazzaStream Bot",
+                               avatar_url=new_avatar)
         flash("Discord-Einstellungen gespeichert ✔", "success")
     else:
         flash("Ungültiger Webhook-Link", "error")
@@ -504,22 +707,76 @@ def update_hls_secret():
         flash("Secret darf nicht leer sein!", "error")
         return redirect(url_for("admin_panel"))
 
-    setting = Setting.query.first() or Setting()
-    setting.hls_secret = new_secret
-    db.session.add(setting)
-    db.session.commit()
-
-    clear_hls_secret_cache()
-    flash("HLS-Secret gespeichert – alle alten Tokens sind jetzt ungültig.", "success")
+    SETTINGS.rotate_hls_secret(new_secret, grace=hls_key_grace)
+    flash(f"HLS-Secret gespeichert – alte Tokens bleiben noch {hls_key_grace} s gültig.", "success")
     return redirect(url_for("admin_panel"))
 
+def hls_playlist_url(suffix: str) -> str:
+    if hls_delivery == "proxy":
+        return url_for("proxy_hls", filename=f"{suffix}.m3u8")
+    return f"{stream_base_url.rstrip('/')}/hls/{suffix}.m3u8"
+
+@app.route("/api/hls_token")
+@login_required
+def api_hls_token():
+    return jsonify(token=generate_hls_token(session["username"], expires_in=hls_token_ttl),
+                   ttl=hls_token_ttl)
+
+@app.route("/api/chat/history")
+@login_required
+def api_chat_history():
+    """Scroll-Back: ``?before=<id>&limit=&user=`` – Seite vor der ältesten
+    bekannten Nachricht, neueste Seite ohne ``before``."""
+    before = request.args.get("before", type=int)
+    limit  = request.args.get("limit", 50, type=int)
+    page   = history_before(before, limit, request.args.get("user") or None)
+    resp = jsonify(page)
+    if before:
+        # Seiten vor einer festen id ändern sich nicht mehr (außer durch Löschen)
+        resp.headers["Cache-Control"] = "private, max-age=60"
+    return resp
+
+@app.route("/hls/auth")
+def hls_auth_check():
+    """Unteranfrage von nginx (auth_request) für jede Datei unter /hls/."""
+    args = parse_qs(urlsplit(request.headers.get("X-Original-URI", "")).query)
+    user  = (args.get("user")  or [""])[0]
+    token = (args.get("token") or [""])[0]
+
+    allowed, ttl = hls_auth.check(user, token)
+    resp = Response(status=204 if allowed else 403)
+    # nginx cached die Entscheidung (proxy_cache) bis der Token abläuft
+    resp.headers["X-Accel-Expires"] = str(ttl)
+    return resp
+
 @app.route("/proxy/hls/<path:filename>")
 @login_required
 def proxy_hls(filename):
     if not validate_hls_token(session["username"], request.args.get("token", "")):
         abort(403)
-    r = requests.get(f"{stream_base_url}/hls/{filename}", stream=True)
-    return (r.iter_content(chunk_size=4096), r.status_code, {"Content-Type": r.headers.get("Content-Type", "application/vnd.apple.mpegurl")})
+
+    # Upstream weg/zu langsam → 502/504 statt 500
+    try:
+        if hls_cache.enabled:
+            obj = hls_cache.get(filename)
+        else:
+            fwd = {k: request.headers[k] for k in PASS_REQUEST_HEADERS if k in request.headers}
+            r = hls_upstream.get(filename, headers=fwd, stream=True)
+    except requests.Timeout:
+        abort(504)
+    except requests.RequestException:
+        abort(502)
+
+    if not hls_cache.enabled:
+        return Response(hls_upstream.iter_body(r), r.status_code,
+                        hls_upstream.response_headers(r))
+    if obj.status != 200:
+        return obj.body, obj.status, obj.headers
+    resp = Response(obj.body, 200, obj.headers)
+    resp.headers["ETag"] = obj.etag
+    # 304 bei unveränderter Playlist, Range direkt aus dem Cache
+    return resp.make_conditional(request, accept_ranges=True,
+                                 complete_length=len(obj.body))
 
 @app.route("/admin/user_info/<username>")
 @admin_required
@@ -540,46 +797,75 @@ def update_user(username):
     user = User.query.filter_by(username=username).first_or_404()
 
     if pw := data.get("new_pw", "").strip():
-        user.password = generate_password_hash(pw)
+        try:
+            user.password = BLOCKING.run(generate_password_hash, pw)
+        except PoolBusy:
+            return jsonify(error="Server ausgelastet"), 503
     if "color"  in data: user.color  = data["color"]
     if "points" in data:
         try:
-            user.points = int(data["points"])
+            points = int(data["points"])
         except ValueError:
             return jsonify(error="points must be int"), 400
+    else:
+        points = None
 
     db.session.commit()
+    if points is not None:
+        LEDGER.set_points(username, points)
+        db.session.refresh(user)
+    USER_CACHE.invalidate(username)
 
     socketio.emit("user_data_changed", {
         "username": user.username,
         "color"   : user.color,
         "points"  : user.points
     })
-    send_user_list()
+    PRESENCE.set_color(user.username, user.color)
 
     return '', 204
 
-if __name__ == '__main__':
-    with app.app_context():
-        db.create_all()
+def bootstrap() -> None:
+    """Tabellen anlegen, Daten migrieren und Admin aus der config übernehmen (einmal pro Start)."""
+    db.create_all()
+    ensure_indexes(Message)
+    migrate_inventory()
+    migrate_stream_keys()
 
-        if config.has_section("admin"):
-            admin_user  = config["admin"].get("username", "").strip()
-            admin_pass  = config["admin"].get("password", "").strip()
-            admin_color = config["admin"].get("color", "#000000")
+    if SETTINGS.cfg("admin", "username") is not None:
+        admin_user  = SETTINGS.cfg("admin", "username", "").strip()
+        admin_pass  = SETTINGS.cfg("admin", "password", "").strip()
+        admin_color = SETTINGS.cfg("admin", "color", "#000000")
 
-            if admin_user and admin_pass \
-               and not User.query.filter_by(username=admin_user).first():
+        if admin_user and admin_pass \
+           and not User.query.filter_by(username=admin_user).first():
 
-                db.session.add(User(
-                    username=admin_user,
-                    password=generate_password_hash(admin_pass),
-                    is_admin=True,
-                    is_active=True,
-                    color=admin_color
-                ))
-                db.session.commit()
+            db.session.add(User(
+                username=admin_user,
+                password=generate_password_hash(admin_pass),
+                is_admin=True,
+                is_active=True,
+                color=admin_color
+            ))
+            db.session.commit()
 
-            sanitize_config()
+        sanitize_config()
 
-    socketio.run(app, host="0.0.0.0", port=5015)
\ No newline at end of file
+if __name__ == '__main__':
+    with app.app_context():
+        # Bei mehreren Workern erledigt serve.py das vorab per --init
+        if "--init" in sys.argv or CLUSTER.worker_count == 1:
+            bootstrap()
+        if "--init" in sys.argv:
+            sys.exit(0)
+
+        warm_chat_history()
+        SETTINGS.reload()
+
+    # docker stop schickt SIGTERM – sauber beenden, damit atexit die
+    # Write-Behind-Queue noch in die DB schreibt
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    WATCHDOG.start()
+    STREAM_KEYS.start(socketio)
+    socketio.run(app, host="0.0.0.0", port=int(os.getenv("PORT", "5015")))
@@ -1,11 +1,118 @@
 # auth.py
 
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
 from functools import wraps
-from flask import redirect, url_for, session
+from flask import redirect, url_for, session, request
+from user_cache import USER_CACHE
 from utils import get_user, check_login as db_check
 
-def login_user(sess, username):
-    user = get_user(username)
+@dataclass(frozen=True)
+class SocketIdentity:
+    """Wer hinter einer sid steckt – einmal beim Connect aus der Session."""
+
+    user_id : int
+    username: str
+    is_admin: bool
+
+_SOCKETS: dict[str, SocketIdentity] = {}
+
+def user_room(username: str) -> str:
+    """Raum mit allen sids eines Users (alle Tabs, alle Worker)."""
+    return f"user:{username}"
+
+def bind_socket(sid: str, sess) -> SocketIdentity | None:
+    username = sess.get("username")
+    user = USER_CACHE.get(username) if username else None
+    if not user or not user.is_active:
+        return None
+    identity = _SOCKETS[sid] = SocketIdentity(user.id, user.username, user.is_admin)
+    return identity
+
+def socket_identity(sid: str | None = None) -> SocketIdentity | None:
+    """Identität der sid – ``None``, sobald der User deaktiviert ist."""
+    identity = _SOCKETS.get(sid or request.sid)
+    if identity is None:
+        return None
+    user = USER_CACHE.get(identity.username)
+    return identity if user and user.is_active else None
+
+def unbind_socket(sid: str) -> SocketIdentity | None:
+    return _SOCKETS.pop(sid, None)
+
+def bound_sockets() -> int:
+    return len(_SOCKETS)
+
+class LoginThrottle:
+    """Begrenzt Login-Versuche pro IP und Fehlversuche pro Username.
+
+    Gezählt wird vor dem Hashing – wer gebremst wird, kostet keine
+    Pool-Zeit. Zustand liegt pro Worker im Speicher (Sticky Sessions).
+    """
+
+    def __init__(self, ip_limit: int = 20, ip_window: float = 60,
+                 user_limit: int = 5, user_window: float = 300,
+                 max_keys: int = 10000):
+        self.ip_limit,   self.ip_window   = ip_limit, ip_window
+        self.user_limit, self.user_window = user_limit, user_window
+        self.max_keys = max_keys
+
+        self._hits: OrderedDict[str, deque] = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.throttled = 0
+
+    def _window(self, key: str, window: float, now: float) -> deque:
+        hits = self._hits.get(key)
+        if hits is None:
+            hits = self._hits[key] = deque()
+            while len(self._hits) > self.max_keys:
+                self._hits.popitem(last=False)
+        self._hits.move_to_end(key)
+        while hits and hits[0] <= now - window:
+            hits.popleft()
+        return hits
+
+    @staticmethod
+    def _wait(hits: deque, limit: int, window: float, now: float) -> int:
+        if len(hits) < limit:
+            return 0
+        return max(1, int(hits[-limit] + window - now) + 1)
+
+    def retry_after(self, ip: str, username: str) -> int:
+        """Zählt den Versuch der IP; > 0 = so viele Sekunden warten."""
+        now = time.monotonic()
+        with self._lock:
+            ip_hits   = self._window(f"ip:{ip}", self.ip_window, now)
+            user_hits = self._window(f"user:{username.lower()}", self.user_window, now)
+            wait = max(self._wait(ip_hits, self.ip_limit, self.ip_window, now),
+                       self._wait(user_hits, self.user_limit, self.user_window, now))
+            if wait:
+                self.throttled += 1
+            else:
+                ip_hits.append(now)
+            return wait
+
+    def failed(self, username: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._window(f"user:{username.lower()}", self.user_window, now).append(now)
+
+    def succeeded(self, username: str) -> None:
+        with self._lock:
+            self._hits.pop(f"user:{username.lower()}", None)
+
+    def stats(self) -> dict:
+        return {"keys": len(self._hits), "throttled": self.throttled}
+
+LOGIN_THROTTLE = LoginThrottle()
+
+def login_user(sess, user):
+    """``user`` ist ein bereits geladener User oder ein Username."""
+    if isinstance(user, str):
+        user = get_user(user)
     if not user or not user.is_active:
         return False
     sess.update({
@@ -18,9 +125,9 @@ def login_user(sess, username):
 def logout_user(sess):
     sess.clear()
 
-def check_login(username, password):
+def check_login(user, password):
 
-    return db_check(username, password)
+    return db_check(user, password)
 
 def login_required(f):
     @wraps(f)
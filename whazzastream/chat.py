@@ -1,43 +1,189 @@
 # chat.py
-from flask      import request
+import time
+from collections import deque
+from flask      import request, session
+from flask_socketio import join_room
+from auth       import bind_socket, socket_identity, user_room
 from markupsafe import escape
-from models     import db, Message, User
-import re
-from smilies    import get_all_smilies
+from cluster    import CLUSTER
+from inventory  import use_effect
+from models     import db, Message
+from smilies    import SMILIE_CATALOG
+from user_cache import USER_CACHE
 
 ALLOWED_EFFECTS = {"rainbow", "pulse", "neon", "updown", "glitch", "sparkle", "shake", "fire", "blur", "wave"}
 
-def handle_chat_messages(socketio):
+HISTORY_SIZE = 50
+PAGE_SIZE    = 50
+MAX_PAGE     = 200
+
+# Ringpuffer der letzten Nachrichten – bereits escaped und fertig fürs Emit,
+# damit ein Connect-Sturm beim Streamstart nicht bei MariaDB landet.
+_history: deque[dict] = deque(maxlen=HISTORY_SIZE)
+_history_loaded = False
+
+def _history_entry(msg_id, username, text, color, font, effect) -> dict:
+    return {
+        "id":       msg_id,
+        "username": username,
+        "color":    color,
+        "font":     font,
+        "effect":   effect,
+        "text":     str(escape(text))
+    }
+
+def warm_chat_history() -> None:
+    """Füllt den Ringpuffer aus der DB (braucht einen App-Kontext)."""
+    global _history_loaded
+    rows = (
+        Message.query
+               .order_by(Message.id.desc())
+               .limit(HISTORY_SIZE)
+               .all()
+    )
+    _history.clear()
+    _history.extend(
+        _history_entry(m.id, m.username, m.text, m.color, m.font, m.effect)
+        for m in reversed(rows)
+    )
+    _history_loaded = True
+
+def reset_chat_history(publish: bool = True, last_id: int | None = None) -> None:
+    """``last_id`` geht mit an die anderen Worker – deren Write-Behind-Queues
+    verwerfen alles bis dahin."""
+    global _history_loaded
+    _history.clear()
+    _history_loaded = True
+    if publish:
+        CLUSTER.publish("chat_clear", {"last_id": last_id})
+
+def _remote_message(payload: dict) -> None:
+    if _history_loaded:
+        _history.append(payload["entry"])
+
+CLUSTER.subscribe("chat", _remote_message)
+CLUSTER.subscribe("chat_clear", lambda _: reset_chat_history(publish=False))
+
+def chat_history() -> list[dict]:
+    if not _history_loaded:
+        warm_chat_history()
+    return list(_history)
+
+class MessageBatcher:
+    """Verteilt ``receive_message`` adaptiv.
+
+    Bis ``threshold`` Nachrichten pro Sekunde geht jede sofort raus. Darüber
+    sammeln sich die Nachrichten ``tick`` Sekunden lang und gehen als *ein*
+    ``receive_messages``-Event (Liste) an alle – ein Frame pro Socket statt
+    einem pro Nachricht. Die Reihenfolge bleibt erhalten: solange ein Batch
+    offen ist, hängt sich auch jede weitere Nachricht hinten an.
+    ``tick = 0`` schaltet das Sammeln ab.
+    """
+
+    def __init__(self, tick: float = 0.075, threshold: int = 20):
+        self.tick      = tick
+        self.threshold = threshold
+        self._socketio = None
+        self._pending: list[dict] = []
+        self._recent: deque[float] = deque()
+        self._scheduled = False
+
+        self.immediate = 0
+        self.batched   = 0
+        self.batches   = 0
+        self.max_batch = 0
+
+    def start(self, socketio) -> None:
+        self._socketio = socketio
+
+    def send(self, msg: dict) -> None:
+        now = time.monotonic()
+        recent = self._recent
+        recent.append(now)
+        while recent[0] <= now - 1:
+            recent.popleft()
+
+        if self.tick <= 0 or (not self._scheduled and len(recent) <= self.threshold):
+            self.immediate += 1
+            self._socketio.emit("receive_message", msg)
+            return
+
+        self._pending.append(msg)
+        if not self._scheduled:
+            self._scheduled = True
+            self._socketio.start_background_task(self._flush_later)
+
+    def _flush_later(self) -> None:
+        self._socketio.sleep(self.tick)
+        batch, self._pending = self._pending, []
+        self._scheduled = False
+        if not batch:
+            return
+        self.batched  += len(batch)
+        self.batches  += 1
+        self.max_batch = max(self.max_batch, len(batch))
+        self._socketio.emit("receive_messages", batch)
+
+    def stats(self) -> dict:
+        return {
+            "tick_ms":   round(self.tick * 1000),
+            "threshold": self.threshold,
+            "rate":      len(self._recent),
+            "immediate": self.immediate,
+            "batched":   self.batched,
+            "batches":   self.batches,
+            "max_batch": self.max_batch,
+        }
+
+BROADCAST = MessageBatcher()
+
+def history_before(before_id: int | None, limit: int = PAGE_SIZE,
+                   username: str | None = None) -> dict:
+    """Eine Seite älterer Nachrichten per Keyset (``id < before_id``) statt
+    OFFSET – jede Seite ist ein Index-Range-Scan, egal wie tief gescrollt.
+
+    Liefert ``{"messages": [...aufsteigend...], "more": bool}``.
+    """
+    limit = max(1, min(int(limit or PAGE_SIZE), MAX_PAGE))
+    q = Message.query.with_entities(Message.id, Message.username, Message.text,
+                                    Message.color, Message.font, Message.effect)
+    if before_id:
+        q = q.filter(Message.id < int(before_id))
+    if username:
+        q = q.filter(Message.username == username)   # ix_messages_username_id
+    rows = q.order_by(Message.id.desc()).limit(limit + 1).all()
+    more = len(rows) > limit
+    return {
+        "messages": [_history_entry(*row) for row in reversed(rows[:limit])],
+        "more":     more,
+    }
+
+def handle_chat_messages(socketio, writer):
+
+    BROADCAST.start(socketio)
 
     @socketio.on("send_message")
     def handle_send_message(data):
 
-        username  = data.get("username")
-        raw_text  = (data.get("text") or "").strip()
-        effect    = data.get("effect")
+        identity = socket_identity()
+        raw_text = ((data or {}).get("text") or "").strip()
+        effect   = (data or {}).get("effect")
 
-        if not username or not raw_text:
+        if identity is None or not raw_text:
             return
 
-        user  = User.query.filter_by(username=username).first()
+        # Name kommt aus dem Handshake, nicht aus dem Payload
+        username = identity.username
+        user  = USER_CACHE.get(username)
+        if not user or not user.is_active:
+            return
         color = user.color if user else "#000000"
         font  = user.font  if user else None
 
-        if effect in ALLOWED_EFFECTS:
-            inv = user.effect_inventory or {}
-            if inv.get(effect, 0) > 0:
-                inv[effect] -= 1
-                user.effect_inventory = inv
-            else:
-                effect = None
-        else:
-            effect = None
-
-        all_smilies = set(get_all_smilies())
-        unlocked    = set(user.unlocked_smilies) if user else set()
+        unlocked = user.unlocked if user else frozenset()
 
-        tags    = re.findall(r':([\w]+):', raw_text)
-        missing = [t for t in tags if t in all_smilies and t not in unlocked]
+        tags    = SMILIE_CATALOG.tags_in(raw_text)
+        missing = [t for t in tags if t not in unlocked]
 
         if missing:
             socketio.emit(
@@ -49,56 +195,60 @@ def handle_chat_messages(socketio):
 
         visible = [t for t in tags if t in unlocked]
 
-        msg = Message(username=username,
-                      text=raw_text,
-                      color=color,
-                      font=font,
-                      effect=effect)
-        db.session.add(msg)
-        db.session.commit()
+        if user and effect in ALLOWED_EFFECTS and user.effect_inventory.get(effect, 0) > 0:
+            if use_effect(user.id, effect):
+                db.session.commit()
+                inv = dict(user.effect_inventory)
+                inv[effect] = max(inv[effect] - 1, 0)
+                user = USER_CACHE.put(username, effect_inventory=inv)
+            else:
+                # Cache war zu optimistisch (anderer Worker hat verbraucht)
+                USER_CACHE.invalidate(username)
+                effect = None
+        else:
+            effect = None
 
-        safe_text = str(escape(raw_text))
-        socketio.emit(
-            "receive_message",
-            {
-                "id": msg.id,
-                "username": username,
-                "color": color,
-                "font": font,
-                "effect": effect,
-                "text": safe_text,
-                "visible_smilies": visible
-            }
-        )
+        msg_id = writer.save(username=username,
+                             text=raw_text,
+                             color=color,
+                             font=font,
+                             effect=effect)
 
+        entry = _history_entry(msg_id, username, raw_text, color, font, effect)
+        if _history_loaded:
+            _history.append(entry)
+        CLUSTER.publish("chat", {"entry": entry})
+
+        BROADCAST.send({**entry, "visible_smilies": visible})
+
+        # Inventar ist privat – nur an die Tabs des Absenders, nicht an alle
         socketio.emit(
             "user_data_changed",
             {
                 "username": username,
-                "points":   user.points,
-                "color":    user.color,
-                "effects":  user.effect_inventory
-            }
+                "points":   user.points if user else 0,
+                "color":    color,
+                "effects":  user.effect_inventory if user else {}
+            },
+            to=user_room(username)
         )
 
     @socketio.on("connect")
-    def handle_connect():
-        history = (
-            Message.query
-                   .order_by(Message.id.desc())
-                   .limit(50)
-                   .all()
-        )
-
-        payload = [
-            {
-                "id":       m.id,
-                "username": m.username,
-                "color":    m.color,
-                "font":     m.font,
-                "effect":   m.effect,
-                "text":     str(escape(m.text))
-            }
-            for m in reversed(history)
-        ]
-        socketio.emit("chat_history", payload, to=request.sid)
+    def handle_connect(auth=None):
+        # Session einmal prüfen; alle weiteren Events lesen nur noch die sid
+        identity = bind_socket(request.sid, session)
+        if identity is None:
+            return False
+        join_room(user_room(identity.username))
+        socketio.emit("chat_history", chat_history(), to=request.sid)
+
+    @socketio.on("chat_history_before")
+    def handle_history_before(data):
+        if socket_identity() is None:
+            return None
+        data = data or {}
+        try:
+            return history_before(data.get("before"), data.get("limit") or PAGE_SIZE,
+                                  data.get("username"))
+        except (TypeError, ValueError):
+            return {"messages": [], "more": False}
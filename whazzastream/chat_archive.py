@@ -0,0 +1,190 @@
+# chat_archive.py
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, select, text
+
+from concurrency import BLOCKING, PoolBusy
+from models import db, Message
+from settings import SETTINGS
+from write_behind import last_message_id
+
+log = logging.getLogger(__name__)
+
+class ChatArchiver:
+    """Hält ``messages`` klein: was älter als ``[chat] retention_days`` ist
+    oder über ``retention_rows`` hinausgeht, wandert in gzip-komprimierte
+    Tagesdateien (``<dir>/chat-YYYY-MM-DD.jsonl.gz``) und wird danach per
+    id gelöscht.
+
+    Gearbeitet wird in Häppchen von ``chunk`` Zeilen mit Pause dazwischen;
+    Komprimieren und Schreiben laufen im Worker-Pool, damit der Event-Loop –
+    und damit der Live-Chat – nichts davon merkt. Erst schreiben, dann
+    löschen: ein Absturz dazwischen kostet höchstens Duplikate im Archiv.
+    Läuft nur auf Worker 0.
+    """
+
+    def __init__(self, app, directory: str = "archive", chunk: int = 1000,
+                 interval: float = 300, pause: float = 0.2):
+        self.app       = app
+        self.directory = directory
+        self.chunk     = chunk
+        self.interval  = interval
+        self.pause     = pause
+        self._socketio = None
+        self._lock = threading.Lock()
+
+        self.runs     = 0
+        self.archived = 0
+        self.chunks   = 0
+        self.clears   = 0
+        self.last_ms  = 0.0
+
+    @staticmethod
+    def policy() -> tuple[int, int]:
+        cfg = SETTINGS.current
+
+        def _int(key):
+            try:
+                return max(0, int(cfg.cfg("chat", key) or 0))
+            except ValueError:
+                return 0
+
+        return _int("retention_days"), _int("retention_rows")
+
+    def _boundary(self, days: int, rows: int) -> int:
+        """Höchste id, die weg darf (0 = nichts zu tun)."""
+        boundary = 0
+        if days:
+            cutoff = datetime.utcnow() - timedelta(days=days)
+            boundary = db.session.execute(
+                select(func.max(Message.id)).where(Message.timestamp < cutoff)
+            ).scalar() or 0
+        if rows:
+            # einmaliger Sprung über den Primärschlüssel, keine Vollsortierung
+            keep_from = db.session.execute(
+                select(Message.id).order_by(Message.id.desc()).offset(rows).limit(1)
+            ).scalar() or 0
+            boundary = max(boundary, keep_from)
+        return boundary
+
+    def _write(self, lines_by_day: dict[str, list[str]]) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        for day, lines in lines_by_day.items():
+            path = os.path.join(self.directory, f"chat-{day}.jsonl.gz")
+            # Anhängen erzeugt ein weiteres gzip-Member – gzip.open liest alles.
+            # Erst den gzip-Strom schließen (Trailer), dann die Datei syncen.
+            with open(path, "ab") as raw:
+                with gzip.GzipFile(fileobj=raw, mode="ab") as gz:
+                    gz.write(("\n".join(lines) + "\n").encode("utf-8"))
+                raw.flush()
+                os.fsync(raw.fileno())
+
+    def _archive_chunk(self, boundary: int) -> int:
+        rows = db.session.execute(
+            select(Message.id, Message.username, Message.text, Message.color,
+                   Message.font, Message.effect, Message.timestamp)
+            .where(Message.id <= boundary)
+            .order_by(Message.id)
+            .limit(self.chunk)
+        ).all()
+        db.session.rollback()
+        if not rows:
+            return 0
+
+        by_day: dict[str, list[str]] = {}
+        for r in rows:
+            ts = r.timestamp or datetime.utcnow()
+            by_day.setdefault(ts.strftime("%Y-%m-%d"), []).append(json.dumps({
+                "id": r.id, "username": r.username, "text": r.text, "color": r.color,
+                "font": r.font, "effect": r.effect, "timestamp": ts.isoformat(),
+            }, ensure_ascii=False))
+        BLOCKING.run(self._write, by_day)
+
+        # genau die archivierten ids – Write-Behind kann Lücken noch füllen
+        db.session.execute(delete(Message).where(Message.id.in_([r.id for r in rows])))
+        db.session.commit()
+        self.chunks += 1
+        return len(rows)
+
+    def run_once(self) -> int:
+        days, rows = self.policy()
+        if not (days or rows):
+            return 0
+
+        started = time.perf_counter()
+        moved = 0
+        with self.app.app_context():
+            boundary = self._boundary(days, rows)
+            while boundary:
+                try:
+                    # pro Häppchen – ein paralleles clear() wartet nie lange
+                    with self._lock:
+                        n = self._archive_chunk(boundary)
+                except PoolBusy:
+                    log.info("Chat-Archiv: Worker-Pool ausgelastet – nächster Lauf")
+                    break
+                if not n:
+                    break
+                moved += n
+                if self._socketio:
+                    self._socketio.sleep(self.pause)
+
+        self.runs    += 1
+        self.last_ms  = round((time.perf_counter() - started) * 1000, 2)
+        if moved:
+            self.archived += moved
+            log.info("Chat-Archiv: %d Nachrichten archiviert", moved)
+        return moved
+
+    def clear(self, floor: int = 0) -> int:
+        """Leert ``messages`` in konstanter Zeit statt Zeile für Zeile.
+
+        Auf MariaDB per TRUNCATE; AUTO_INCREMENT wird danach über die alte
+        höchste id gesetzt, damit ids nie wiederkommen (Clients filtern
+        doppelte ids, Scroll-Back pagint über id). Die Write-Behind-Zähler
+        laufen ohnehin weiter und starten nach einem Neustart von dort;
+        ``floor`` deckt ids ab, die noch in deren Queues warten. Liefert die
+        alte höchste id.
+        """
+        with self._lock:
+            last = max(last_message_id(), floor)
+            db.session.commit()
+            if db.engine.dialect.name in ("mysql", "mariadb"):
+                db.session.execute(text("TRUNCATE TABLE messages"))
+                db.session.execute(text(f"ALTER TABLE messages AUTO_INCREMENT = {int(last) + 1}"))
+            else:
+                # SQLite u. a.: DELETE ohne WHERE nutzt dort die Truncate-Optimierung
+                db.session.execute(delete(Message))
+            db.session.commit()
+            self.clears += 1
+            return last
+
+    def start(self, socketio) -> None:
+        self._socketio = socketio
+        socketio.start_background_task(self._run)
+
+    def _run(self) -> None:
+        while True:
+            self._socketio.sleep(self.interval)
+            try:
+                self.run_once()
+            except Exception:
+                log.exception("Chat-Archivierung fehlgeschlagen")
+
+    def stats(self) -> dict:
+        days, rows = self.policy()
+        return {
+            "retention_days": days,
+            "retention_rows": rows,
+            "runs":           self.runs,
+            "archived":       self.archived,
+            "chunks":         self.chunks,
+            "clears":         self.clears,
+            "last_ms":        self.last_ms,
+        }
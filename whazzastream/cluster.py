@@ -0,0 +1,382 @@
+# cluster.py
+"""Gemeinsamer Zustand für mehrere Worker-Prozesse.
+
+Ein *Store* hält die Presence (sid → User mit TTL), einen kleinen
+Event-Bus, über den sich die Worker gegenseitig Cache-Invalidierungen
+u. Ä. mitteilen, und gemeinsame Zähler (``next_id``). Backends:
+
+* ``local``                 – nur dieser Prozess (Standard, Tests)
+* ``sqlite:///pfad/zur.db`` – mehrere Prozesse auf einem Host, ohne Broker
+* ``redis://host:6379/0``   – mehrere Hosts (braucht das Paket ``redis``)
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+
+log = logging.getLogger(__name__)
+
+BUS_KEEP = 1000
+
+class LocalStore:
+    """In-Process-Store – Verhalten wie ein externer Store, nur ohne Prozessgrenze."""
+
+    def __init__(self):
+        self._sids: dict[str, tuple[str, float]] = {}
+        self._users: dict[str, set[str]] = {}
+        self._colors: dict[str, str] = {}
+        self._events: deque[tuple[int, str, dict]] = deque(maxlen=BUS_KEEP)
+        self._seq = 0
+        self._counters: dict[str, int] = {}
+        self._swept = 0.0
+        self._lock = threading.Lock()
+
+    def _drop_sid(self, sid: str) -> str | None:
+        entry = self._sids.pop(sid, None)
+        if not entry:
+            return None
+        username = entry[0]
+        sids = self._users.get(username)
+        if sids is not None:
+            sids.discard(sid)
+            if not sids:
+                del self._users[username]
+        return username
+
+    def _sweep(self) -> None:
+        now = time.time()
+        if now - self._swept < 1:
+            return
+        self._swept = now
+        for sid, (_, expires) in list(self._sids.items()):
+            if expires < now:
+                self._drop_sid(sid)
+
+    def add_sid(self, sid: str, username: str, color: str, ttl: float) -> None:
+        with self._lock:
+            self._drop_sid(sid)
+            self._sids[sid] = (username, time.time() + ttl)
+            self._users.setdefault(username, set()).add(sid)
+            self._colors[username] = color
+
+    def touch(self, sids, ttl: float) -> None:
+        expires = time.time() + ttl
+        with self._lock:
+            for sid in sids:
+                if sid in self._sids:
+                    self._sids[sid] = (self._sids[sid][0], expires)
+
+    def remove_sid(self, sid: str) -> str | None:
+        with self._lock:
+            return self._drop_sid(sid)
+
+    def drop_user(self, username: str) -> list[str]:
+        with self._lock:
+            sids = list(self._users.get(username, ()))
+            for sid in sids:
+                self._drop_sid(sid)
+            return sids
+
+    def set_color(self, username: str, color: str) -> None:
+        with self._lock:
+            self._colors[username] = color
+
+    def users(self) -> dict[str, str]:
+        with self._lock:
+            self._sweep()
+            return {u: self._colors.get(u, "#000000") for u in self._users}
+
+    def publish(self, topic: str, payload: dict) -> None:
+        with self._lock:
+            self._seq += 1
+            self._events.append((self._seq, topic, payload))
+
+    def fetch(self, after: int) -> tuple[int, list[tuple[str, dict]]]:
+        with self._lock:
+            events = [(t, p) for seq, t, p in self._events if seq > after]
+            return self._seq, events
+
+    def next_id(self, name: str, floor: int = 0) -> int:
+        """Nächster Wert des Zählers ``name``, mindestens ``floor + 1``."""
+        with self._lock:
+            value = max(self._counters.get(name, 0), floor) + 1
+            self._counters[name] = value
+            return value
+
+class SqliteStore:
+    """Dateibasierter Store für mehrere Worker auf demselben Host."""
+
+    def __init__(self, path: str):
+        self._db = sqlite3.connect(path, timeout=5, isolation_level=None,
+                                   check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript("""
+                CREATE TABLE IF NOT EXISTS presence (
+                    sid TEXT PRIMARY KEY, username TEXT NOT NULL, expires REAL NOT NULL);
+                CREATE INDEX IF NOT EXISTS presence_user ON presence(username);
+                CREATE TABLE IF NOT EXISTS colors (
+                    username TEXT PRIMARY KEY, color TEXT NOT NULL);
+                CREATE TABLE IF NOT EXISTS events (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT, topic TEXT NOT NULL, payload TEXT NOT NULL);
+                CREATE TABLE IF NOT EXISTS counters (
+                    name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            """)
+
+    def _q(self, sql: str, args=()) -> list:
+        with self._lock:
+            return self._db.execute(sql, args).fetchall()
+
+    def add_sid(self, sid, username, color, ttl) -> None:
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute("INSERT OR REPLACE INTO presence VALUES (?, ?, ?)",
+                                 (sid, username, time.time() + ttl))
+                self._db.execute("INSERT OR REPLACE INTO colors VALUES (?, ?)",
+                                 (username, color))
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def touch(self, sids, ttl) -> None:
+        sids = list(sids)
+        if sids:
+            marks = ",".join("?" * len(sids))
+            self._q(f"UPDATE presence SET expires = ? WHERE sid IN ({marks})",
+                    (time.time() + ttl, *sids))
+
+    def remove_sid(self, sid) -> str | None:
+        rows = self._q("DELETE FROM presence WHERE sid = ? RETURNING username", (sid,))
+        return rows[0][0] if rows else None
+
+    def drop_user(self, username) -> list[str]:
+        rows = self._q("DELETE FROM presence WHERE username = ? RETURNING sid", (username,))
+        return [r[0] for r in rows]
+
+    def set_color(self, username, color) -> None:
+        self._q("INSERT OR REPLACE INTO colors VALUES (?, ?)", (username, color))
+
+    def users(self) -> dict[str, str]:
+        self._q("DELETE FROM presence WHERE expires < ?", (time.time(),))
+        rows = self._q("""
+            SELECT DISTINCT p.username, COALESCE(c.color, '#000000')
+              FROM presence p LEFT JOIN colors c ON c.username = p.username
+        """)
+        return dict(rows)
+
+    def publish(self, topic, payload) -> None:
+        with self._lock:
+            cur = self._db.execute("INSERT INTO events (topic, payload) VALUES (?, ?)",
+                                   (topic, json.dumps(payload)))
+            if cur.lastrowid % 100 == 0:
+                self._db.execute("DELETE FROM events WHERE seq <= ?",
+                                 (cur.lastrowid - BUS_KEEP,))
+
+    def fetch(self, after) -> tuple[int, list[tuple[str, dict]]]:
+        rows = self._q("SELECT seq, topic, payload FROM events WHERE seq > ? ORDER BY seq",
+                       (after,))
+        if not rows:
+            last = self._q("SELECT COALESCE(MAX(seq), 0) FROM events")[0][0]
+            return max(after, last), []
+        return rows[-1][0], [(t, json.loads(p)) for _, t, p in rows]
+
+    def next_id(self, name, floor=0) -> int:
+        rows = self._q("""
+            INSERT INTO counters VALUES (?, ?)
+                ON CONFLICT(name) DO UPDATE SET value = MAX(value, ?) + 1
+            RETURNING value
+        """, (name, floor + 1, floor))
+        return rows[0][0]
+
+class RedisStore:
+    """Store für mehrere Hosts; teilt sich den Redis gern mit der Socket.IO-Queue."""
+
+    PREFIX = "whazzastream:"
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("Für presence_store = redis://… wird das Paket 'redis' benötigt") from e
+        self._r = redis.Redis.from_url(url, decode_responses=True)
+        self._sids    = self.PREFIX + "presence:sids"
+        self._expires = self.PREFIX + "presence:expires"
+        self._colors  = self.PREFIX + "presence:colors"
+        self._by_user = self.PREFIX + "presence:user:"   # + Username → Set der sids
+        self._bus     = self.PREFIX + "bus"
+        self._seq     = self.PREFIX + "bus:seq"
+        # INCR und ZADD in einem Schritt – sonst sieht ein Poller zwischen
+        # beiden schon die neue seq und überspringt das Event
+        self._publish = self._r.register_script("""
+            local seq = redis.call('INCR', KEYS[1])
+            redis.call('ZADD', KEYS[2], seq, '[' .. seq .. ',' .. ARGV[1] .. ']')
+            redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', seq - tonumber(ARGV[2]))
+            return seq
+        """)
+        self._next_id = self._r.register_script("""
+            local floor = tonumber(ARGV[1])
+            if tonumber(redis.call('GET', KEYS[1]) or 0) < floor then
+                redis.call('SET', KEYS[1], floor)
+            end
+            return redis.call('INCR', KEYS[1])
+        """)
+
+    def add_sid(self, sid, username, color, ttl) -> None:
+        pipe = self._r.pipeline()
+        pipe.hset(self._sids, sid, username)
+        pipe.zadd(self._expires, {sid: time.time() + ttl})
+        pipe.hset(self._colors, username, color)
+        pipe.sadd(self._by_user + username, sid)
+        pipe.execute()
+
+    def touch(self, sids, ttl) -> None:
+        sids = list(sids)
+        if sids:
+            expires = time.time() + ttl
+            self._r.zadd(self._expires, {sid: expires for sid in sids}, xx=True)
+
+    def remove_sid(self, sid) -> str | None:
+        username = self._r.hget(self._sids, sid)
+        if username is None:
+            return None
+        pipe = self._r.pipeline()
+        pipe.hdel(self._sids, sid)
+        pipe.zrem(self._expires, sid)
+        pipe.srem(self._by_user + username, sid)
+        pipe.execute()
+        return username
+
+    def drop_user(self, username) -> list[str]:
+        key = self._by_user + username
+        sids = list(self._r.smembers(key))
+        pipe = self._r.pipeline()
+        if sids:
+            pipe.hdel(self._sids, *sids)
+            pipe.zrem(self._expires, *sids)
+        pipe.delete(key)
+        pipe.execute()
+        return sids
+
+    def set_color(self, username, color) -> None:
+        self._r.hset(self._colors, username, color)
+
+    def users(self) -> dict[str, str]:
+        now = time.time()
+        expired = self._r.zrangebyscore(self._expires, "-inf", now)
+        if expired:
+            owners = self._r.hmget(self._sids, expired)
+            pipe = self._r.pipeline()
+            pipe.hdel(self._sids, *expired)
+            pipe.zrem(self._expires, *expired)
+            for sid, username in zip(expired, owners):
+                if username is not None:
+                    pipe.srem(self._by_user + username, sid)
+            pipe.execute()
+        names = set(self._r.hvals(self._sids))
+        if not names:
+            return {}
+        names = sorted(names)
+        colors = self._r.hmget(self._colors, names)
+        return {n: c or "#000000" for n, c in zip(names, colors)}
+
+    def publish(self, topic, payload) -> None:
+        self._publish(keys=[self._seq, self._bus],
+                      args=[json.dumps([topic, payload])[1:-1], BUS_KEEP])
+
+    def fetch(self, after) -> tuple[int, list[tuple[str, dict]]]:
+        raw = self._r.zrangebyscore(self._bus, f"({after}", "+inf")
+        if not raw:
+            # nie über den Zähler springen; nur zurück, falls Redis neu anfing
+            return min(after, int(self._r.get(self._seq) or 0)), []
+        events = [json.loads(r) for r in raw]
+        return events[-1][0], [(t, p) for _, t, p in events]
+
+    def next_id(self, name, floor=0) -> int:
+        return int(self._next_id(keys=[self.PREFIX + "counter:" + name], args=[floor]))
+
+def create_store(url: str | None):
+    url = (url or "local").strip()
+    if url == "local":
+        return LocalStore()
+    if url.startswith("sqlite:///"):
+        # wie bei SQLAlchemy: sqlite:///relativ.db bzw. sqlite:////absolut.db
+        return SqliteStore(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisStore(url)
+    raise ValueError(f"Unbekannter presence_store: {url}")
+
+class Cluster:
+    """Verteilt Events an die anderen Worker und ruft lokale Handler auf."""
+
+    def __init__(self, store=None, sync_interval: float = 1.0):
+        self.store = store or LocalStore()
+        self.sync_interval = sync_interval
+        self.node_id = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.worker_index = 0
+        self.worker_count = 1
+
+        self._handlers: dict[str, list] = {}
+        self._seq = 0
+        self._socketio = None
+
+        self.published = 0
+        self.received  = 0
+        self.errors    = 0
+
+    def subscribe(self, topic: str, handler) -> None:
+        self._handlers.setdefault(topic, []).append(handler)
+
+    def publish(self, topic: str, payload: dict | None = None) -> None:
+        """Nur für die *anderen* Worker; lokal hat der Aufrufer schon gehandelt."""
+        try:
+            self.store.publish(topic, {"origin": self.node_id, **(payload or {})})
+            self.published += 1
+        except Exception:
+            self.errors += 1
+            log.exception("Cluster-Event %s nicht veröffentlicht", topic)
+
+    def poll(self) -> None:
+        self._seq, events = self.store.fetch(self._seq)
+        for topic, payload in events:
+            if payload.get("origin") == self.node_id:
+                continue
+            self.received += 1
+            for handler in self._handlers.get(topic, ()):
+                try:
+                    handler(payload)
+                except Exception:
+                    self.errors += 1
+                    log.exception("Cluster-Handler für %s fehlgeschlagen", topic)
+
+    def start(self, socketio) -> None:
+        self._socketio = socketio
+        self._seq, _ = self.store.fetch(0)
+        socketio.start_background_task(self._run)
+
+    def _run(self) -> None:
+        while True:
+            self._socketio.sleep(self.sync_interval)
+            try:
+                self.poll()
+            except Exception:
+                self.errors += 1
+                log.exception("Cluster-Sync fehlgeschlagen")
+
+    def stats(self) -> dict:
+        return {
+            "node_id":   self.node_id,
+            "worker":    f"{self.worker_index + 1}/{self.worker_count}",
+            "store":     type(self.store).__name__,
+            "published": self.published,
+            "received":  self.received,
+            "errors":    self.errors,
+        }
+
+CLUSTER = Cluster()
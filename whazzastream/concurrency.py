@@ -0,0 +1,133 @@
+# concurrency.py
+"""Nebenläufigkeitsmodell: die App läuft komplett grün (eventlet, monkey-
+gepatcht in app.py). Netzwerk-I/O – requests, pymysql, redis – kooperiert
+damit von selbst. Was trotzdem CPU blockiert (Passwort-Hashing), läuft über
+``BLOCKING`` in echten OS-Threads; ``LoopWatchdog`` meldet Event-Loop-Hänger.
+"""
+import logging
+import sys
+import time
+import traceback
+
+import eventlet
+from eventlet import tpool
+from eventlet.semaphore import Semaphore
+
+log = logging.getLogger(__name__)
+
+# ungepatchtes threading: echte OS-Threads und OS-Thread-IDs
+_real_threading = eventlet.patcher.original("threading")
+
+class PoolBusy(RuntimeError):
+    """Die Warteschlange des Worker-Pools ist voll."""
+
+class BlockingPool:
+    """Begrenzter Pool für blockierende Aufrufe mit Buchführung."""
+
+    def __init__(self, size: int = 4, max_queue: int = 64):
+        self.size      = size
+        self.max_queue = max_queue
+        self._sem = Semaphore(size)
+
+        self.active    = 0
+        self.waiting   = 0
+        self.completed = 0
+        self.rejected  = 0
+        self.total_ms  = 0.0
+        self.max_ms    = 0.0
+
+    def resize(self, size: int, max_queue: int) -> None:
+        self.size, self.max_queue = size, max_queue
+        self._sem = Semaphore(size)
+
+    def run(self, fn, *args, **kwargs):
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise PoolBusy(f"{self.waiting} Aufträge warten bereits")
+
+        self.waiting += 1
+        try:
+            self._sem.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.active += 1
+        started = time.perf_counter()
+        try:
+            return tpool.execute(fn, *args, **kwargs)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            self.active    -= 1
+            self.completed += 1
+            self.total_ms  += elapsed
+            self.max_ms     = max(self.max_ms, elapsed)
+            self._sem.release()
+
+    def stats(self) -> dict:
+        return {
+            "size":      self.size,
+            "active":    self.active,
+            "waiting":   self.waiting,
+            "max_queue": self.max_queue,
+            "completed": self.completed,
+            "rejected":  self.rejected,
+            "avg_ms":    round(self.total_ms / self.completed, 2) if self.completed else 0.0,
+            "max_ms":    round(self.max_ms, 2),
+        }
+
+BLOCKING = BlockingPool()
+
+class LoopWatchdog:
+    """Ein grüner Ticker setzt einen Zeitstempel; ein echter OS-Thread prüft
+    ihn und loggt bei Hängern über ``threshold`` den Stack des Verursachers."""
+
+    def __init__(self, threshold: float = 0.25, interval: float = 0.05):
+        self.threshold = threshold
+        self.interval  = interval
+
+        self._beat = time.monotonic()
+        self._loop_thread = None
+
+        self.stalls   = 0
+        self.max_ms   = 0.0
+        self.last_stack = ""
+
+    def start(self) -> None:
+        self._loop_thread = _real_threading.get_ident()
+        eventlet.spawn(self._tick)
+        _real_threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+
+    def _tick(self) -> None:
+        while True:
+            self._beat = time.monotonic()
+            eventlet.sleep(self.interval)
+
+    def _watch(self) -> None:
+        real_sleep = eventlet.patcher.original("time").sleep
+        reported = None
+        while True:
+            real_sleep(self.interval)
+            beat  = self._beat
+            stall = time.monotonic() - beat
+            if stall < self.threshold:
+                if reported is not None:
+                    self.max_ms = max(self.max_ms, reported)
+                    reported = None
+                continue
+            if reported is None:
+                self.stalls += 1
+                frame = sys._current_frames().get(self._loop_thread)
+                self.last_stack = "".join(traceback.format_stack(frame)) if frame else ""
+                log.warning("Event-Loop blockiert seit %.0f ms:\n%s",
+                            stall * 1000, self.last_stack)
+            reported = stall * 1000
+
+    def stats(self) -> dict:
+        return {
+            "threshold_ms": round(self.threshold * 1000),
+            "stalls":       self.stalls,
+            "max_ms":       round(self.max_ms, 1),
+            "last_stack":   self.last_stack,
+        }
+
+WATCHDOG = LoopWatchdog()
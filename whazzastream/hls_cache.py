@@ -0,0 +1,300 @@
+# hls_cache.py
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Header, die Player für Range- und Conditional-Requests brauchen
+PASS_RESPONSE_HEADERS = ("Content-Type", "Content-Length", "ETag", "Last-Modified",
+                         "Cache-Control", "Accept-Ranges", "Content-Range")
+PASS_REQUEST_HEADERS  = ("Range", "If-None-Match", "If-Modified-Since", "If-Range")
+
+class UpstreamClient:
+    """Keep-Alive-Verbindungen zu nginx statt eines Handshakes pro Request.
+
+    ``sign`` liefert die Query-Parameter (``user``/``token``), mit denen
+    nginx per auth_request prüft – jeder Upstream-Request trägt sie.
+    """
+
+    def __init__(self, base_url: str, pool_size: int = 32,
+                 connect_timeout: float = 3, read_timeout: float = 10):
+        self.base_url = base_url.rstrip("/")
+        self.timeout  = (connect_timeout, read_timeout)
+        self.sign     = None
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.requests = 0
+        self.errors   = 0
+
+    def get(self, filename: str, headers: dict | None = None,
+            stream: bool = False, params: dict | None = None) -> requests.Response:
+        self.requests += 1
+        if self.sign:
+            params = {**self.sign(), **(params or {})}
+        try:
+            return self.session.get(f"{self.base_url}/hls/{filename}",
+                                    headers=headers, stream=stream, params=params,
+                                    timeout=self.timeout)
+        except requests.RequestException:
+            self.errors += 1
+            raise
+
+    @staticmethod
+    def response_headers(r: requests.Response) -> dict:
+        headers = {k: r.headers[k] for k in PASS_RESPONSE_HEADERS if k in r.headers}
+        headers.setdefault("Content-Type", "application/vnd.apple.mpegurl")
+        return headers
+
+    @staticmethod
+    def chunk_size(content_length: str | None) -> int:
+        """Große Segmente in großen Happen, kleine in einem Rutsch."""
+        try:
+            length = int(content_length)
+        except (TypeError, ValueError):
+            return 256 * 1024
+        return min(max(length // 4, 64 * 1024), 1024 * 1024)
+
+    def iter_body(self, r: requests.Response):
+        try:
+            yield from r.iter_content(self.chunk_size(r.headers.get("Content-Length")))
+        finally:
+            r.close()
+
+    def stats(self) -> dict:
+        return {"requests": self.requests, "errors": self.errors}
+
+class CachedObject:
+    __slots__ = ("status", "body", "headers", "expires", "etag")
+
+    def __init__(self, status: int, body: bytes, headers: dict, expires: float | None):
+        self.status  = status
+        self.body    = body
+        self.headers = headers
+        self.expires = expires
+        # nginx liefert meist eine ETag; sonst aus dem Inhalt ableiten
+        self.etag = headers.get("ETag") or f'"{hashlib.sha1(body).hexdigest()}"'
+
+class _Flight:
+    """Ein laufender Upstream-Request, auf den weitere Anfragen warten."""
+    __slots__ = ("done", "obj", "exc")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.obj: CachedObject | None = None
+        self.exc: Exception | None = None
+
+class SegmentCache:
+    """Gemeinsamer Cache für HLS-Dateien vor nginx.
+
+    Gleichzeitige Misses auf dieselbe Datei werden zu *einem* Upstream-Request
+    zusammengefasst. Playlists leben ``playlist_ttl`` Sekunden (= hls_fragment),
+    Segmente sind unveränderlich und fliegen raus, sobald sie aus dem
+    Playlist-Fenster fallen – oder per LRU, wenn ``max_bytes`` erreicht ist.
+    """
+
+    def __init__(self, client: UpstreamClient, max_bytes: int = 64 * 1024 * 1024,
+                 playlist_ttl: float = 2.0):
+        self.client       = client
+        self.max_bytes    = max_bytes
+        self.playlist_ttl = playlist_ttl
+
+        self._entries: OrderedDict[str, CachedObject] = OrderedDict()
+        self._inflight: dict[str, _Flight] = {}
+        self._windows: dict[str, set[str]] = {}
+        self._bytes = 0
+        self._lock  = threading.Lock()
+
+        self.hits        = 0
+        self.misses      = 0
+        self.coalesced   = 0
+        self.evictions   = 0
+        self.bytes_cache = 0
+        self.bytes_upstream = 0
+
+    @staticmethod
+    def is_playlist(filename: str) -> bool:
+        return filename.endswith(".m3u8")
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _fetch(self, filename: str) -> CachedObject:
+        r = self.client.get(filename)
+        headers = self.client.response_headers(r)
+        headers.pop("Content-Range", None)
+        expires = time.monotonic() + self.playlist_ttl if self.is_playlist(filename) else None
+        return CachedObject(r.status_code, r.content, headers, expires)
+
+    def _lookup(self, filename: str) -> CachedObject | None:
+        obj = self._entries.get(filename)
+        if obj is None:
+            return None
+        if obj.expires is not None and obj.expires < time.monotonic():
+            self._drop(filename)
+            return None
+        self._entries.move_to_end(filename)
+        return obj
+
+    def _drop(self, filename: str) -> None:
+        obj = self._entries.pop(filename, None)
+        if obj is not None:
+            self._bytes -= len(obj.body)
+
+    def _store(self, filename: str, obj: CachedObject) -> None:
+        if obj.status != 200 and not self.is_playlist(filename):
+            return
+        if len(obj.body) > self.max_bytes // 4:
+            return
+        self._drop(filename)
+        self._entries[filename] = obj
+        self._bytes += len(obj.body)
+        while self._bytes > self.max_bytes and self._entries:
+            old, _ = next(iter(self._entries.items()))
+            self._drop(old)
+            self.evictions += 1
+        if self.is_playlist(filename) and obj.status == 200:
+            self._slide_window(filename, obj.body)
+
+    def _slide_window(self, playlist: str, body: bytes) -> None:
+        prefix = playlist.rpartition("/")[0]
+        prefix = f"{prefix}/" if prefix else ""
+        window = {
+            prefix + line.strip()
+            for line in body.decode("utf-8", "replace").splitlines()
+            if line.strip() and not line.startswith("#")
+        }
+        gone = self._windows.get(playlist, set()) - window
+        self._windows[playlist] = window
+        still_listed = set().union(*self._windows.values()) if self._windows else set()
+        for seg in gone - still_listed:
+            if seg in self._entries:
+                self._drop(seg)
+                self.evictions += 1
+
+    def get(self, filename: str) -> CachedObject:
+        with self._lock:
+            obj = self._lookup(filename)
+            if obj is not None:
+                self.hits += 1
+                self.bytes_cache += len(obj.body)
+                return obj
+            flight = self._inflight.get(filename)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[filename] = _Flight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            if not flight.done.wait(15):
+                raise requests.Timeout(f"Upstream-Request für {filename} hängt")
+            # Fehler des Leaders teilen statt selbst nachzufragen – sonst
+            # trifft jeder Wartende den ohnehin kränkelnden Upstream
+            if flight.exc is not None:
+                raise flight.exc
+            self.bytes_cache += len(flight.obj.body)
+            return flight.obj
+
+        try:
+            flight.obj = self._fetch(filename)
+            self.bytes_upstream += len(flight.obj.body)
+            with self._lock:
+                self._store(filename, flight.obj)
+            return flight.obj
+        except Exception as e:
+            flight.exc = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(filename, None)
+            flight.done.set()
+
+    def stats(self) -> dict:
+        served = self.hits + self.coalesced
+        total  = served + self.misses
+        return {
+            "entries":        len(self._entries),
+            "bytes":          self._bytes,
+            "max_bytes":      self.max_bytes,
+            "hits":           self.hits,
+            "misses":         self.misses,
+            "coalesced":      self.coalesced,
+            "evictions":      self.evictions,
+            "hit_ratio":      round(served / total, 3) if total else 0.0,
+            "bytes_cache":    self.bytes_cache,
+            "bytes_upstream": self.bytes_upstream,
+        }
+
+class TokenDecisions:
+    """Merkt sich Allow/Deny für (user, token) bis zum Ablauf des Tokens.
+
+    Vor nginx-``auth_request`` geschaltet: jedes Segment löst eine
+    Unteranfrage aus, die HMAC-Prüfung läuft aber nur einmal pro Token.
+    """
+
+    def __init__(self, validate, max_size: int = 10000, deny_ttl: int = 10):
+        self.validate = validate
+        self.max_size = max_size
+        self.deny_ttl = deny_ttl
+
+        self._entries: OrderedDict[tuple[str, str], tuple[bool, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits    = 0
+        self.misses  = 0
+        self.allowed = 0
+        self.denied  = 0
+
+    @staticmethod
+    def _expiry(token: str) -> float:
+        try:
+            return float(token.split(":", 1)[0])
+        except ValueError:
+            return 0.0
+
+    def check(self, username: str, token: str) -> tuple[bool, int]:
+        """Liefert (erlaubt, Sekunden, die die Entscheidung gültig bleibt)."""
+        key = (username, token)
+        now = time.time()
+        with self._lock:
+            hit = self._entries.get(key)
+            if hit is not None and hit[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                allowed, until = hit
+                return allowed, max(1, int(until - now))
+
+        self.misses += 1
+        allowed = bool(username and token) and self.validate(username, token)
+        until   = self._expiry(token) if allowed else now + self.deny_ttl
+        with self._lock:
+            self._entries[key] = (allowed, until)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        if allowed:
+            self.allowed += 1
+        else:
+            self.denied += 1
+        return allowed, max(1, int(until - now))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits":    self.hits,
+            "misses":  self.misses,
+            "allowed": self.allowed,
+            "denied":  self.denied,
+        }
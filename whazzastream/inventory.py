@@ -0,0 +1,35 @@
+# inventory.py
+"""Effekt-Tokens und freigeschaltete Smilies als eigene Zeilen.
+
+Alle Funktionen committen nicht selbst – sie laufen in der Transaktion des
+Aufrufers (z. B. zusammen mit der Punkte-Buchung in ``LEDGER.apply``).
+"""
+from sqlalchemy import insert, update
+
+from models import db, UserEffect, UserSmilie
+
+def use_effect(user_id: int, effect: str) -> bool:
+    """Verbraucht einen Token: ``count = count - 1 WHERE count > 0``."""
+    result = db.session.execute(
+        update(UserEffect)
+        .where(UserEffect.user_id == user_id,
+               UserEffect.effect == effect,
+               UserEffect.count > 0)
+        .values(count=UserEffect.count - 1)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+def add_effect(user_id: int, effect: str, n: int = 1) -> None:
+    result = db.session.execute(
+        update(UserEffect)
+        .where(UserEffect.user_id == user_id, UserEffect.effect == effect)
+        .values(count=UserEffect.count + n)
+        .execution_options(synchronize_session=False)
+    )
+    if not result.rowcount:
+        db.session.execute(insert(UserEffect).values(user_id=user_id, effect=effect, count=n))
+
+def add_smilie(user_id: int, smilie: str) -> None:
+    """Wirft IntegrityError, wenn der Smilie schon freigeschaltet ist."""
+    db.session.execute(insert(UserSmilie).values(user_id=user_id, smilie=smilie))
@@ -0,0 +1,178 @@
+# ledger.py
+import logging
+from datetime import datetime
+
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+
+from models import db, User, PointsLedger
+from user_cache import USER_CACHE
+from write_behind import BatchInserter
+
+log = logging.getLogger(__name__)
+
+class LedgerConflict(RuntimeError):
+    """``extra`` verletzte einen Unique-Constraint; die Buchung ist zurückgerollt."""
+
+class Ledger:
+    """Punkte-Änderungen als bedingte, atomare UPDATEs plus Buchungsjournal.
+
+    ``apply`` prüft Deckung und weitere Bedingungen im WHERE desselben
+    UPDATE (``points = points + :delta WHERE points >= :cost``) – kein
+    Read-Check-Write in Python, kein Doppelausgeben bei parallelen Käufen.
+    Jede Buchung landet gebündelt (Write-Behind) in ``points_ledger``;
+    ``reconcile`` vergleicht regelmäßig Journal und Kontostand.
+    """
+
+    def __init__(self):
+        self.queue: BatchInserter | None = None
+        self.app = None
+        self.reconcile_interval = 3600
+        self._socketio = None
+        self._suspect: dict[str, int] = {}
+
+        self.applied      = 0
+        self.rejected     = 0
+        self.reconciled   = 0
+        self.corrections  = 0
+        self.last_drift   = 0
+
+    def init_app(self, app, interval: float = 0.5, batch_size: int = 500) -> None:
+        self.app   = app
+        self.queue = BatchInserter(app, PointsLedger, interval, batch_size)
+
+    def record(self, username: str, delta: int, reason: str, item: str | None = None) -> None:
+        if delta:
+            self.queue.add({"username": username, "delta": delta, "reason": reason,
+                            "item": item, "timestamp": datetime.utcnow()})
+
+    def apply(self, username: str, delta: int, reason: str, item: str | None = None,
+              where=(), extra=None, **changes):
+        """Bucht ``delta`` (negativ = Ausgabe) samt ``changes`` in einem UPDATE.
+
+        ``extra`` läuft danach in derselben Transaktion (z. B. Inventar);
+        wirft es IntegrityError, wird die Buchung zurückgerollt und
+        ``LedgerConflict`` geworfen. Liefert den neuen UserState oder ``None``,
+        wenn Deckung oder eine der ``where``-Bedingungen fehlte.
+        """
+        conditions = [User.username == username, *where]
+        if delta < 0:
+            conditions.append(User.points >= -delta)
+
+        updated = User.query.filter(*conditions).update(
+            {"points": func.coalesce(User.points, 0) + delta, **changes},
+            synchronize_session=False
+        )
+        try:
+            if updated and extra is not None:
+                extra()
+            db.session.commit()
+        except IntegrityError as e:
+            db.session.rollback()
+            self.rejected += 1
+            raise LedgerConflict(f"{reason} {item or ''} für {username}".strip()) from e
+        if not updated:
+            self.rejected += 1
+            return None
+
+        self.applied += 1
+        self.record(username, delta, reason, item)
+        USER_CACHE.invalidate(username)
+        return USER_CACHE.get(username)
+
+    def set_points(self, username: str, points: int, reason: str = "admin") -> int | None:
+        """Setzt einen Kontostand (Admin) per Compare-and-Set und bucht die Differenz."""
+        for _ in range(5):
+            row = db.session.execute(
+                select(User.points).where(User.username == username)
+            ).first()
+            if row is None:
+                return None
+            current = row[0]
+            updated = User.query.filter(
+                User.username == username,
+                User.points.is_(None) if current is None else User.points == current
+            ).update({"points": points}, synchronize_session=False)
+            db.session.commit()
+            if updated:
+                self.record(username, points - (current or 0), reason)
+                USER_CACHE.invalidate(username)
+                return points
+        raise RuntimeError(f"Kontostand von {username} ändert sich laufend")
+
+    def reconcile(self) -> int:
+        """Vergleicht Kontostände mit der Journalsumme.
+
+        User ohne Buchungen bekommen einen Eröffnungssaldo. Abweichungen
+        werden erst korrigiert, wenn sie zwei Läufe in Folge gleich bleiben –
+        so zählen noch nicht geschriebene Batches anderer Worker nicht.
+        """
+        self.queue.flush_all()
+        with self.app.app_context():
+            rows = db.session.execute(
+                select(User.username,
+                       func.coalesce(User.points, 0),
+                       func.coalesce(func.sum(PointsLedger.delta), 0),
+                       func.count(PointsLedger.id))
+                .outerjoin(PointsLedger, PointsLedger.username == User.username)
+                .group_by(User.username, User.points)
+            ).all()
+
+            drift, fixes = {}, []
+            for username, points, journal, entries in rows:
+                if not entries:
+                    if points:
+                        fixes.append({"username": username, "delta": points,
+                                      "reason": "opening", "item": None,
+                                      "timestamp": datetime.utcnow()})
+                    continue
+                diff = points - journal
+                if not diff:
+                    continue
+                drift[username] = diff
+                if self._suspect.get(username) == diff:
+                    log.warning("Punkte-Abweichung bei %s: Konto %d, Journal %d",
+                                username, points, journal)
+                    fixes.append({"username": username, "delta": diff,
+                                  "reason": "reconcile", "item": None,
+                                  "timestamp": datetime.utcnow()})
+                    self.corrections += 1
+                    drift.pop(username)
+
+            if fixes:
+                db.session.execute(PointsLedger.__table__.insert(), fixes)
+            db.session.commit()
+
+        self._suspect   = drift
+        self.last_drift = len(drift)
+        self.reconciled += 1
+        return len(fixes)
+
+    def start(self, socketio, reconcile: bool = True) -> None:
+        self._socketio = socketio
+        self.queue.start(socketio)
+        if reconcile:
+            socketio.start_background_task(self._run)
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.reconcile()
+            except Exception:
+                log.exception("Punkte-Abgleich fehlgeschlagen")
+            self._socketio.sleep(self.reconcile_interval)
+
+    def close(self) -> None:
+        self.queue.flush_all()
+
+    def stats(self) -> dict:
+        return {
+            "applied":     self.applied,
+            "rejected":    self.rejected,
+            "reconciled":  self.reconciled,
+            "corrections": self.corrections,
+            "drift":       self.last_drift,
+            **self.queue.stats(),
+        }
+
+LEDGER = Ledger()
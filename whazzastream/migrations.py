@@ -0,0 +1,63 @@
+# migrations.py
+"""Einmalige Datenumzüge, idempotent – laufen bei jedem bootstrap() mit."""
+import logging
+
+from models import db, StreamKey, User, UserEffect, UserSmilie
+from stream_keys import hash_stream_key, is_hashed
+
+log = logging.getLogger(__name__)
+
+def migrate_inventory(batch: int = 200) -> int:
+    """Überträgt die JSON-Spalten ``unlocked_smilies``/``effect_inventory``
+    in ``user_smilies``/``user_effects`` und leert sie danach."""
+    moved = 0
+    last_id = 0
+    while True:
+        users = (User.query.filter(User.id > last_id)
+                 .order_by(User.id).limit(batch).all())
+        if not users:
+            break
+        last_id = users[-1].id
+
+        for user in users:
+            smilies = list(user.unlocked_smilies or ())
+            effects = dict(user.effect_inventory or {})
+            if not smilies and not effects:
+                continue
+
+            have = {s.smilie for s in user.smilies}
+            for name in dict.fromkeys(smilies):
+                if name not in have:
+                    user.smilies.append(UserSmilie(smilie=name))
+
+            rows = {e.effect: e for e in user.effects}
+            for name, count in effects.items():
+                if name in rows:
+                    rows[name].count += int(count or 0)
+                else:
+                    user.effects.append(UserEffect(effect=name, count=int(count or 0)))
+
+            user.unlocked_smilies = []
+            user.effect_inventory = {}
+            moved += 1
+        db.session.commit()
+
+    if moved:
+        log.info("Inventar von %d Usern in Tabellen übertragen", moved)
+    return moved
+
+def migrate_stream_keys() -> int:
+    """Ersetzt Klartext-Stream-Keys durch ihren Hash."""
+    keys = [sk for sk in StreamKey.query.all() if not is_hashed(sk.key)]
+    for sk in keys:
+        sk.key = hash_stream_key(sk.key)
+    if keys:
+        db.session.commit()
+        log.info("%d Stream-Keys gehasht", len(keys))
+    return len(keys)
+
+def ensure_indexes(*models) -> None:
+    """``create_all`` legt Indizes nur mit neuen Tabellen an – hier nachziehen."""
+    for model in models:
+        for index in model.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
@@ -1,5 +1,6 @@
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.dialects.sqlite import JSON
+from sqlalchemy import event
 from sqlalchemy.ext.mutable import MutableList, MutableDict
 from datetime import date, datetime
 
@@ -17,15 +18,48 @@ class User(db.Model):
     is_active= db.Column(db.Boolean, default=True)
 
     points            = db.Column(db.Integer, default=0)
-    unlocked_smilies  = db.Column(MutableList.as_mutable(JSON),
-                                  default=lambda: ["melting"])
+    # Altbestand – wird von migrations.migrate_inventory() in
+    # user_smilies/user_effects übertragen und danach geleert
+    unlocked_smilies  = db.Column(MutableList.as_mutable(JSON), default=list)
     effect_inventory  = db.Column(MutableDict.as_mutable(JSON), default=dict)
 
     last_daily_bonus  = db.Column(db.Date,     nullable=True)
     last_stream_bonus = db.Column(db.DateTime, nullable=True)
 
+    smilies = db.relationship("UserSmilie", lazy="selectin",
+                              cascade="all, delete-orphan")
+    effects = db.relationship("UserEffect", lazy="selectin",
+                              cascade="all, delete-orphan")
+
+DEFAULT_SMILIES = ("melting",)
+
+class UserSmilie(db.Model):
+    __tablename__ = "user_smilies"
+
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"),
+                        primary_key=True)
+    smilie  = db.Column(db.String(120), primary_key=True)
+
+class UserEffect(db.Model):
+    __tablename__ = "user_effects"
+
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"),
+                        primary_key=True)
+    effect  = db.Column(db.String(40), primary_key=True)
+    count   = db.Column(db.Integer, nullable=False, default=0)
+
+@event.listens_for(User, "init")
+def _default_smilies(user, args, kwargs):
+    if "smilies" not in kwargs:
+        user.smilies = [UserSmilie(smilie=s) for s in DEFAULT_SMILIES]
+
 class Message(db.Model):
     __tablename__ = "messages"
+    __table_args__ = (
+        # Scroll-Back pro User (Keyset über id) und Aufräumen nach Alter
+        db.Index("ix_messages_username_id", "username", "id"),
+        db.Index("ix_messages_timestamp", "timestamp"),
+    )
 
     id       = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), nullable=False)
@@ -35,9 +69,34 @@ class Message(db.Model):
     effect   = db.Column(db.String(40),  nullable=True)
     timestamp= db.Column(db.DateTime, server_default=db.func.now())
 
+class PointsLedger(db.Model):
+    """Append-only: jede Punkte-Änderung als eigene Zeile."""
+    __tablename__ = "points_ledger"
+
+    id        = db.Column(db.Integer, primary_key=True)
+    username  = db.Column(db.String(80), nullable=False, index=True)
+    delta     = db.Column(db.Integer,    nullable=False)
+    reason    = db.Column(db.String(40), nullable=False)
+    item      = db.Column(db.String(120), nullable=True)
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class HlsKey(db.Model):
+    """Schlüsselbund für HLS-Tokens; alte Keys laufen erst nach einer Gnadenfrist aus."""
+    __tablename__ = "hls_keys"
+
+    id         = db.Column(db.Integer, primary_key=True)
+    secret     = db.Column(db.String(255), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    retires_at = db.Column(db.DateTime, nullable=True)
+
 class StreamKey(db.Model):
     id  = db.Column(db.Integer, primary_key=True)
-    key = db.Column(db.String(128), unique=True, nullable=False)
+    key = db.Column(db.String(128), unique=True, nullable=False)  # "sha256:<hex>"
+
+    @property
+    def fingerprint(self) -> str:
+        """Kurzform des Hashs für die Admin-Liste – der Key selbst ist weg."""
+        return self.key.partition(":")[2][:12] or self.key[:12]
 
 class Setting(db.Model):
     id                    = db.Column(db.Integer, primary_key=True)
@@ -0,0 +1,235 @@
+# notifier.py
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from settings import SETTINGS
+
+log = logging.getLogger(__name__)
+
+MAX_EMBEDS = 10     # Discord-Limit pro Webhook-Nachricht …
+MAX_CHARS  = 6000   # … und für Titel/Beschreibung/Felder aller Embeds zusammen
+
+class Notifier:
+    """Discord-Webhooks im Hintergrund statt im Request.
+
+    ``notify`` legt das Embed nur in eine SQLite-Queue (überlebt Neustarts,
+    alle Worker eines Hosts teilen sie); ein Dispatcher auf Worker 0 sendet
+    bis zu zehn wartende Embeds (zusammen höchstens ``MAX_CHARS`` Zeichen)
+    als *eine* Nachricht über eine Keep-Alive-Session. Netzfehler und 5xx
+    werden mit exponentiellem Backoff wiederholt, 429 und ``X-RateLimit-*``
+    pausieren den Versand so lange wie verlangt. Lehnt Discord einen
+    Sammel-Post ab, gehen dessen Embeds einzeln raus – verworfen wird nur,
+    was auch allein abgelehnt wird.
+    """
+
+    def __init__(self, path: str = "notify_queue.db", interval: float = 1.0,
+                 max_attempts: int = 8, backoff: float = 2.0, max_backoff: float = 300):
+        self.path         = path
+        self.interval     = interval
+        self.max_attempts = max_attempts
+        self.backoff      = backoff
+        self.max_backoff  = max_backoff
+
+        self._db = None
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+        self._solo_through = 0   # bis zu dieser id einzeln senden
+        self._socketio = None
+
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=2,
+                                                   max_retries=0))
+
+        self.queued       = 0
+        self.sent         = 0
+        self.messages     = 0
+        self.retries      = 0
+        self.dropped      = 0
+        self.rate_limited = 0
+        self.last_error   = ""
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, timeout=5, isolation_level=None,
+                                       check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, embed TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0, next_at REAL NOT NULL)""")
+        return self._db
+
+    def _q(self, sql: str, args=()) -> list:
+        with self._lock:
+            return self._conn().execute(sql, args).fetchall()
+
+    @staticmethod
+    def webhook() -> str | None:
+        return (SETTINGS.current.cfg("discord", "webhook") or "").strip() or None
+
+    # -- Einreihen --------------------------------------------------------
+    def notify(self, text: str, color: int = 0xFF0000) -> None:
+        """Reiht ein Embed ein; wirft nur, wenn kein Webhook gesetzt ist."""
+        if not self.webhook():
+            raise RuntimeError("DISCORD_WEBHOOK nicht gesetzt")
+        self._q("INSERT INTO outbox (embed, next_at) VALUES (?, ?)",
+                (json.dumps({"description": text, "color": color}), time.time()))
+        self.queued += 1
+
+    def depth(self) -> int:
+        return self._q("SELECT COUNT(*) FROM outbox")[0][0]
+
+    # -- Versand ----------------------------------------------------------
+    def _pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _rate_headers(self, r: requests.Response) -> None:
+        if r.headers.get("X-RateLimit-Remaining") == "0":
+            try:
+                self._pause(float(r.headers.get("X-RateLimit-Reset-After", 1)))
+            except ValueError:
+                self._pause(1)
+
+    @staticmethod
+    def _retry_after(r: requests.Response) -> float:
+        try:
+            return float(r.json().get("retry_after"))
+        except (ValueError, TypeError, AttributeError):
+            pass
+        try:
+            return float(r.headers.get("Retry-After", 1))
+        except ValueError:
+            return 1.0
+
+    @staticmethod
+    def _embed_chars(embed: dict) -> int:
+        chars = len(embed.get("title") or "") + len(embed.get("description") or "")
+        chars += sum(len(f.get("name") or "") + len(f.get("value") or "")
+                     for f in embed.get("fields") or ())
+        chars += len((embed.get("footer") or {}).get("text") or "")
+        chars += len((embed.get("author") or {}).get("name") or "")
+        return chars
+
+    def _batch(self, rows: list) -> tuple[list[int], list[dict]]:
+        limit = 1 if rows[0][0] <= self._solo_through else MAX_EMBEDS
+        ids, embeds, chars = [], [], 0
+        for row_id, raw in rows[:limit]:
+            embed = json.loads(raw)
+            size  = self._embed_chars(embed)
+            if embeds and chars + size > MAX_CHARS:
+                break
+            ids.append(row_id)
+            embeds.append(embed)
+            chars += size
+        return ids, embeds
+
+    def _reschedule(self, ids: list[int]) -> None:
+        marks = ",".join("?" * len(ids))
+        rows = self._q(f"SELECT id, attempts FROM outbox WHERE id IN ({marks})", ids)
+        for row_id, attempts in rows:
+            if attempts + 1 >= self.max_attempts:
+                self._q("DELETE FROM outbox WHERE id = ?", (row_id,))
+                self.dropped += 1
+                log.error("Discord: Nachricht %d nach %d Versuchen verworfen",
+                          row_id, attempts + 1)
+                continue
+            delay = min(self.backoff * 2 ** attempts, self.max_backoff)
+            self._q("UPDATE outbox SET attempts = attempts + 1, next_at = ? WHERE id = ?",
+                    (time.time() + delay, row_id))
+            self.retries += 1
+
+    def dispatch(self) -> int:
+        """Sendet einen Schwung; liefert die Zahl zugestellter Embeds."""
+        if time.monotonic() < self._paused_until:
+            return 0
+        rows = self._q("SELECT id, embed FROM outbox WHERE next_at <= ? ORDER BY id LIMIT ?",
+                       (time.time(), MAX_EMBEDS))
+        if not rows:
+            return 0
+        webhook = self.webhook()
+        if not webhook:
+            return 0
+
+        ids, embeds = self._batch(rows)
+        cfg = SETTINGS.current
+        payload = {
+            "username":   cfg.cfg("discord", "username") or "WhazzaStream Bot",
+            "avatar_url": cfg.cfg("discord", "avatar_url", ""),
+            "embeds":     embeds,
+        }
+        try:
+            r = self.session.post(webhook, json=payload, timeout=(3, 10))
+        except requests.RequestException as e:
+            self.last_error = str(e)
+            log.warning("Discord nicht erreichbar: %s", e)
+            self._reschedule(ids)
+            return 0
+
+        self._rate_headers(r)
+        if r.status_code == 429:
+            self.rate_limited += 1
+            self._pause(self._retry_after(r))
+            return 0
+        if r.status_code >= 500:
+            self.last_error = f"HTTP {r.status_code}"
+            self._reschedule(ids)
+            return 0
+
+        if r.status_code >= 400 and len(ids) > 1:
+            # welches Embed stört, sagt Discord nicht – einzeln nachschicken
+            self._solo_through = ids[-1]
+            self.last_error = f"HTTP {r.status_code}: {r.text[:200]}"
+            log.warning("Discord lehnt Sammel-Post ab (%s) – sende %d Embeds einzeln",
+                        self.last_error, len(ids))
+            return 0
+
+        marks = ",".join("?" * len(ids))
+        self._q(f"DELETE FROM outbox WHERE id IN ({marks})", ids)
+        if r.status_code >= 400:
+            # falscher/gelöschter Webhook o. Ä. – Wiederholen hilft nicht
+            self.dropped += len(ids)
+            self.last_error = f"HTTP {r.status_code}: {r.text[:200]}"
+            log.error("Discord lehnt %d Embeds ab: %s", len(ids), self.last_error)
+            return 0
+        self.sent     += len(ids)
+        self.messages += 1
+        return len(ids)
+
+    def start(self, socketio, dispatch: bool = True) -> None:
+        self._socketio = socketio
+        if dispatch:
+            socketio.start_background_task(self._run)
+
+    def _run(self) -> None:
+        while True:
+            self._socketio.sleep(self.interval)
+            try:
+                while self.dispatch():
+                    pass
+            except Exception:
+                log.exception("Discord-Dispatcher fehlgeschlagen")
+
+    def stats(self) -> dict:
+        try:
+            depth = self.depth()
+        except sqlite3.Error:
+            depth = None
+        return {
+            "depth":        depth,
+            "queued":       self.queued,
+            "sent":         self.sent,
+            "messages":     self.messages,
+            "retries":      self.retries,
+            "dropped":      self.dropped,
+            "rate_limited": self.rate_limited,
+            "paused_s":     max(0, round(self._paused_until - time.monotonic(), 1)),
+            "last_error":   self.last_error,
+        }
+
+NOTIFIER = Notifier()
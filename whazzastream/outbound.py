@@ -0,0 +1,205 @@
+# outbound.py
+import json
+import logging
+import time
+
+from engineio import packet as eio_packet
+from eventlet.queue import Queue
+
+log = logging.getLogger(__name__)
+
+def _merge_presence(old: list, new: list) -> list:
+    # Client setzt pro User nur den letzten Stand – die letzte Op reicht
+    return list({c["username"]: c for c in old + new}.values())
+
+def _merge_user_data(old: dict, new: dict) -> dict:
+    return {**old, **new}
+
+# Event → (Schlüssel aus Payload, Zusammenführen). Nur Zustände, keine Chat-
+# Nachrichten: deren Reihenfolge und Vollständigkeit bleiben unangetastet.
+COALESCE = {
+    "online_users":      (lambda p: None,                                   lambda o, n: n),
+    "stream_state":      (lambda p: None,                                   lambda o, n: n),
+    "presence_delta":    (lambda p: None,                                   _merge_presence),
+    "user_data_changed": (lambda p: p.get("username") if isinstance(p, dict) else False,
+                          _merge_user_data),
+}
+
+class OutboundQueue(Queue):
+    """Sendepuffer einer Engine.IO-Verbindung mit Obergrenze.
+
+    Sobald sich Pakete stauen, ersetzt ein neuer Zustand (``COALESCE``) den
+    noch wartenden alten – ein langsamer Client bekommt nur den neuesten.
+    Über ``max_bytes``/``max_messages`` gilt die Verbindung als langsam,
+    über dem Doppelten werden neue Pakete verworfen und ``overflow`` gesetzt;
+    ``OutboundGuard`` trennt solche Clients dann.
+    """
+
+    def __init__(self, guard: "OutboundGuard"):
+        super().__init__()
+        self.guard = guard
+        self.bytes = 0
+        self.slow_since: float | None = None
+        self.overflow = False
+        self._pending: dict[tuple, eio_packet.Packet] = {}
+        self._keys: dict[int, tuple] = {}
+
+    @staticmethod
+    def _size(pkt) -> int:
+        data = getattr(pkt, "data", None)
+        return len(data) if isinstance(data, (str, bytes)) else 0
+
+    @staticmethod
+    def _event(pkt) -> str | None:
+        data = getattr(pkt, "data", None)
+        if getattr(pkt, "packet_type", None) != eio_packet.MESSAGE \
+                or not isinstance(data, str) or not data.startswith('2["'):
+            return None
+        end = data.find('"', 3)
+        return data[3:end] if end > 0 else None
+
+    def _discard(self, pkt) -> None:
+        self.queue.remove(pkt)
+        key = self._keys.pop(id(pkt), None)
+        if key is not None and self._pending.get(key) is pkt:
+            del self._pending[key]
+        self.bytes -= self._size(pkt)
+        self.task_done()
+        self.guard.coalesced += 1
+
+    def _coalesce(self, pkt, name: str) -> bool:
+        """True, wenn ``pkt`` schon im Puffer steht (an Stelle des alten)."""
+        key_of, merge = COALESCE[name]
+        try:
+            _, payload = json.loads(pkt.data[1:])
+        except ValueError:
+            return False
+        sub = key_of(payload)
+        if sub is False:
+            return False
+        if name == "online_users":
+            # der Snapshot enthält alles, was noch wartende Deltas sagen wollten
+            stale = self._pending.get(("presence_delta", None))
+            if stale is not None:
+                self._discard(stale)
+        key = (name, sub)
+        old = self._pending.get(key)
+        if old is not None:
+            _, old_payload = json.loads(old.data[1:])
+            pkt = eio_packet.Packet(eio_packet.MESSAGE, data="2" + json.dumps(
+                [name, merge(old_payload, payload)], separators=(",", ":")))
+            # an der Position des alten Pakets – sonst überholt es spätere Snapshots
+            self.queue[self.queue.index(old)] = pkt
+            self._keys.pop(id(old), None)
+            self.bytes += self._size(pkt) - self._size(old)
+            self.guard.coalesced += 1
+        self._pending[key] = pkt
+        self._keys[id(pkt)] = key
+        return old is not None
+
+    def _put(self, item):
+        guard = self.guard
+        name  = self._event(item)
+        if name is not None:
+            if self.overflow:
+                guard.dropped += 1
+                return
+            if name in COALESCE and self.queue and self._coalesce(item, name):
+                return
+
+        super()._put(item)
+        self.bytes += self._size(item)
+
+        depth = len(self.queue)
+        if self.bytes > guard.max_bytes or depth > guard.max_messages:
+            if self.slow_since is None:
+                self.slow_since = time.monotonic()
+            if self.bytes > 2 * guard.max_bytes or depth > 2 * guard.max_messages:
+                self.overflow = True
+        else:
+            self.slow_since = None
+
+    def _get(self):
+        item = super()._get()
+        self.bytes -= self._size(item)
+        key = self._keys.pop(id(item), None)
+        if key is not None and self._pending.get(key) is item:
+            del self._pending[key]
+        if not self.queue:
+            self.slow_since = None
+        return item
+
+class OutboundGuard:
+    """Gibt jeder Verbindung eine ``OutboundQueue`` und trennt Clients,
+    die länger als ``slow_timeout`` Sekunden über dem Limit hängen oder es
+    um das Doppelte überschreiten. Sie verbinden sich neu und bekommen den
+    aktuellen Stand (Chat-Historie, Online-Liste) frisch.
+    """
+
+    def __init__(self, max_bytes: int = 512 * 1024, max_messages: int = 500,
+                 slow_timeout: float = 15, interval: float = 1.0):
+        self.max_bytes    = max_bytes
+        self.max_messages = max_messages
+        self.slow_timeout = slow_timeout
+        self.interval     = interval
+        self._socketio = None
+
+        self.coalesced    = 0
+        self.dropped      = 0
+        self.disconnected = 0
+        self._last = {"sockets": 0, "depth": 0, "bytes": 0, "max_depth": 0,
+                      "max_bytes": 0, "slow": 0}
+
+    def install(self, socketio) -> None:
+        """Muss vor der ersten Verbindung laufen."""
+        self._socketio = socketio
+        socketio.server.eio.create_queue = lambda *a, **kw: OutboundQueue(self)
+        socketio.start_background_task(self._run)
+
+    def sweep(self) -> None:
+        now = time.monotonic()
+        eio = self._socketio.server.eio
+        sockets = depth = total = max_depth = max_bytes = slow = 0
+        for eio_sid, sock in list(eio.sockets.items()):
+            q = sock.queue
+            if not isinstance(q, OutboundQueue):
+                continue
+            sockets  += 1
+            n         = len(q.queue)
+            depth    += n
+            total    += q.bytes
+            max_depth = max(max_depth, n)
+            max_bytes = max(max_bytes, q.bytes)
+            if q.slow_since is None and not q.overflow:
+                continue
+            slow += 1
+            if q.overflow or now - q.slow_since >= self.slow_timeout:
+                log.info("Langsamer Client %s getrennt (%d Pakete, %d Bytes)",
+                         eio_sid, n, q.bytes)
+                self.disconnected += 1
+                try:
+                    eio.disconnect(eio_sid)
+                except Exception:
+                    log.exception("Trennen von %s fehlgeschlagen", eio_sid)
+        self._last = {"sockets": sockets, "depth": depth, "bytes": total,
+                      "max_depth": max_depth, "max_bytes": max_bytes, "slow": slow}
+
+    def _run(self) -> None:
+        while True:
+            self._socketio.sleep(self.interval)
+            try:
+                self.sweep()
+            except Exception:
+                log.exception("Outbound-Sweep fehlgeschlagen")
+
+    def stats(self) -> dict:
+        return {
+            **self._last,
+            "limit_bytes":    self.max_bytes,
+            "limit_messages": self.max_messages,
+            "coalesced":      self.coalesced,
+            "dropped":        self.dropped,
+            "disconnected":   self.disconnected,
+        }
+
+OUTBOUND = OutboundGuard()
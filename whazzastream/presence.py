@@ -0,0 +1,141 @@
+# presence.py
+import logging
+import threading
+import time
+
+from cluster import CLUSTER
+
+log = logging.getLogger(__name__)
+
+class Presence:
+    """Wer ist online? Neue Clients bekommen einen Snapshot, alle anderen
+    nur kleine ``presence_delta``-Events, die pro Tick zusammengefasst werden.
+
+    Der eigentliche Zustand liegt im Cluster-Store (sid → User mit TTL), damit
+    mehrere Worker dieselbe Liste sehen und abgestürzte Worker keine
+    Geister-User hinterlassen. Jeder Worker verlängert nur seine eigenen sids.
+    """
+
+    def __init__(self, tick: float = 0.25, ttl: float = 30):
+        self.tick = tick
+        self.ttl  = ttl
+
+        self._local: dict[str, str] = {}     # sids dieses Workers → username
+        self._announced: dict[str, str] = {} # was dieser Worker zuletzt gesendet hat
+        self._dirty: set[str] = set()
+        self._lock = threading.Lock()
+        self._socketio = None
+
+        self.broadcasts = 0
+        self.deltas     = 0
+
+    @property
+    def store(self):
+        return CLUSTER.store
+
+    def start(self, socketio) -> None:
+        self._socketio = socketio
+        socketio.start_background_task(self._run)
+
+    def join(self, sid: str, username: str, color: str) -> None:
+        self._local[sid] = username
+        self.store.add_sid(sid, username, color, self.ttl)
+        self._dirty.add(username)
+
+        self._socketio.emit(
+            "online_users",
+            [{**u, "online": True} for u in self.snapshot()],
+            to=sid
+        )
+
+    def leave(self, sid: str) -> str | None:
+        self._local.pop(sid, None)
+        username = self.store.remove_sid(sid)
+        if username:
+            self._dirty.add(username)
+        return username
+
+    def drop_user(self, username: str) -> list[str]:
+        """Entfernt alle Verbindungen eines Users (auf allen Workern) und liefert deren sids."""
+        sids = self.store.drop_user(username)
+        for sid in sids:
+            self._local.pop(sid, None)
+        self._dirty.add(username)
+        return sids
+
+    def set_color(self, username: str, color: str) -> None:
+        self.store.set_color(username, color)
+        self._dirty.add(username)
+
+    def is_online(self, username: str) -> bool:
+        return username in self.store.users()
+
+    def usernames(self) -> set[str]:
+        return set(self.store.users())
+
+    def snapshot(self) -> list[dict]:
+        return [
+            {"username": name, "color": color}
+            for name, color in sorted(self.store.users().items())
+        ]
+
+    def _collect(self) -> list[dict]:
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            if not dirty:
+                return []
+            online  = self.store.users()
+            changes = []
+            for name in sorted(dirty):
+                color = online.get(name)
+                seen  = self._announced.get(name)
+                if color is not None and seen is None:
+                    changes.append({"op": "join", "username": name, "color": color})
+                    self._announced[name] = color
+                elif color is None and seen is not None:
+                    changes.append({"op": "leave", "username": name})
+                    del self._announced[name]
+                elif color is not None and seen != color:
+                    changes.append({"op": "color", "username": name, "color": color})
+                    self._announced[name] = color
+            return changes
+
+    def flush(self) -> None:
+        changes = self._collect()
+        if changes:
+            self._socketio.emit("presence_delta", changes)
+            self.broadcasts += 1
+            self.deltas     += len(changes)
+
+    def reconcile(self) -> None:
+        """Gleicht mit dem Store ab – fängt abgelaufene sids anderer Worker ab."""
+        self._dirty.update(self.store.users())
+        self._dirty.update(self._announced)
+
+    def _run(self) -> None:
+        touched = reconciled = time.monotonic()
+        while True:
+            self._socketio.sleep(self.tick)
+            now = time.monotonic()
+            try:
+                if now - touched >= self.ttl / 3:
+                    self.store.touch(list(self._local), self.ttl)
+                    touched = now
+                if now - reconciled >= self.ttl:
+                    self.reconcile()
+                    reconciled = now
+                if self._dirty:
+                    self.flush()
+            except Exception:
+                log.exception("Presence-Tick fehlgeschlagen")
+
+    def stats(self) -> dict:
+        return {
+            "online":     len(self.store.users()),
+            "local_sids": len(self._local),
+            "pending":    len(self._dirty),
+            "broadcasts": self.broadcasts,
+            "deltas":     self.deltas,
+        }
+
+PRESENCE = Presence()
@@ -0,0 +1,64 @@
+# serve.py
+"""Startet einen oder mehrere app.py-Worker.
+
+Mit ``[cluster] workers = 1`` (Standard) wird einfach app.py ausgeführt.
+Bei mehreren Workern bekommt jeder einen eigenen Port ab ``base_port``;
+davor gehört ein Reverse-Proxy mit Sticky Sessions (siehe nginx/web.conf).
+"""
+import os
+import signal
+import subprocess
+import sys
+from configparser import ConfigParser
+
+CFG_PATH = "config/config.cfg"
+
+def main() -> int:
+    cfg = ConfigParser(interpolation=None)
+    cfg.read(CFG_PATH)
+    section   = cfg["cluster"] if cfg.has_section("cluster") else {}
+    workers   = int(section.get("workers", "1") or 1)
+    base_port = int(section.get("base_port", "5015") or 5015)
+    store     = (section.get("presence_store", "local") or "local").strip()
+    queue     = (section.get("message_queue", "") or "").strip()
+
+    app_py = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+    if workers <= 1:
+        os.execv(sys.executable, [sys.executable, app_py])
+
+    if store == "local" or not queue:
+        print("Für mehrere Worker müssen presence_store (sqlite:///… oder redis://…) "
+              "und message_queue in [cluster] gesetzt sein.", file=sys.stderr)
+        return 1
+
+    subprocess.run([sys.executable, app_py, "--init"], check=True)
+
+    procs = []
+    for i in range(workers):
+        env = dict(os.environ,
+                   PORT=str(base_port + i),
+                   WORKER_INDEX=str(i),
+                   WORKER_COUNT=str(workers))
+        procs.append(subprocess.Popen([sys.executable, app_py], env=env))
+
+    def _stop(signum, _frame):
+        for p in procs:
+            if p.poll() is None:
+                p.send_signal(signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    # Stirbt ein Worker, fährt der Rest herunter – Docker startet neu
+    exit_code = 0
+    while procs:
+        pid, status = os.wait()
+        for p in list(procs):
+            if p.pid == pid:
+                procs.remove(p)
+                exit_code = exit_code or os.waitstatus_to_exitcode(status)
+                _stop(None, None)
+    return exit_code
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,246 @@
+# settings.py
+import logging
+import os
+import secrets
+import tempfile
+import threading
+import time
+from configparser import ConfigParser
+from calendar import timegm
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from types import MappingProxyType
+
+from cluster import CLUSTER
+from models import db, Setting, HlsKey
+
+log = logging.getLogger(__name__)
+
+SETTING_FIELDS = ("stream_suffix", "daily_bonus", "stream_bonus_points",
+                  "stream_bonus_interval", "smilie_cost", "color_cost",
+                  "font_cost", "effect_cost", "hls_secret")
+
+@dataclass(frozen=True)
+class SettingsSnapshot:
+    """Unveränderlicher Stand aus ``Setting``-Zeile und config.cfg."""
+
+    version              : int
+    stream_suffix        : str
+    daily_bonus          : int
+    stream_bonus_points  : int
+    stream_bonus_interval: int
+    smilie_cost          : int
+    color_cost           : int
+    font_cost            : int
+    effect_cost          : int
+    hls_secret           : str
+    # (kid, secret, läuft ab um – Epoch oder None), neuester zuerst
+    hls_keys             : tuple = field(repr=False)
+    config               : MappingProxyType = field(repr=False)
+
+    def cfg(self, section: str, key: str, default=None):
+        return self.config.get(section, {}).get(key, default)
+
+def _defaults() -> dict:
+    return {
+        "stream_suffix": "whazzaStream", "daily_bonus": 20,
+        "stream_bonus_points": 20, "stream_bonus_interval": 30,
+        "smilie_cost": 50, "color_cost": 200, "font_cost": 300,
+        "effect_cost": 25, "hls_secret": "",
+    }
+
+class SettingsService:
+    """Eine Stelle für Einstellungen: ``SETTINGS.current`` liest nur Speicher.
+
+    Admin-Änderungen laufen über ``update``/``update_config``; danach gibt es
+    einen neuen Snapshot mit höherer ``version``, registrierte Listener werden
+    aufgerufen und die anderen Worker laden per Cluster-Event neu. Von Hand
+    geänderte config.cfg wird per mtime erkannt (höchstens alle
+    ``check_interval`` Sekunden ein stat).
+    """
+
+    def __init__(self, check_interval: float = 2.0):
+        self.check_interval = check_interval
+        self.app  = None
+        self.path = None
+
+        self._config: MappingProxyType = MappingProxyType({})
+        self._mtime: float | None = None
+        self._checked = 0.0
+        self._snapshot: SettingsSnapshot | None = None
+        self._version = 0
+        self._lock = threading.RLock()
+        self._listeners = []
+
+        self.reloads = 0
+
+    def load(self, path: str) -> None:
+        """config.cfg einlesen – geht schon vor App und DB."""
+        self.path = path
+        self._load_config()
+
+    def init_app(self, app) -> None:
+        self.app = app
+
+    # -- config.cfg -------------------------------------------------------
+    def _load_config(self) -> None:
+        parser = ConfigParser(interpolation=None)
+        parser.read(self.path)
+        self._config = MappingProxyType({
+            name: MappingProxyType(dict(parser[name])) for name in parser.sections()
+        })
+        try:
+            self._mtime = os.stat(self.path).st_mtime
+        except OSError:
+            self._mtime = None
+
+    def cfg(self, section: str, key: str, default=None):
+        """Config-Wert ohne DB – auch vor dem ersten Snapshot nutzbar."""
+        return self._config.get(section, {}).get(key, default)
+
+    def _config_changed(self) -> bool:
+        now = time.monotonic()
+        if now - self._checked < self.check_interval:
+            return False
+        self._checked = now
+        try:
+            return os.stat(self.path).st_mtime != self._mtime
+        except OSError:
+            return False
+
+    # -- Snapshot ---------------------------------------------------------
+    def _load_setting(self) -> dict:
+        with self.app.app_context():
+            row = Setting.query.first()
+            if not row:
+                row = Setting()
+                db.session.add(row)
+            if not row.hls_secret:
+                row.hls_secret = secrets.token_urlsafe(32)
+            if row in db.session.new or db.session.is_modified(row):
+                db.session.commit()
+
+            values = _defaults()
+            for name in SETTING_FIELDS:
+                value = getattr(row, name, None)
+                if value is not None:
+                    values[name] = value
+            values["hls_keys"] = self._load_keys(row.hls_secret)
+            return values
+
+    @staticmethod
+    def _load_keys(fallback_secret: str) -> tuple:
+        keys = HlsKey.query.order_by(HlsKey.id.desc()).all()
+        if not keys:
+            # Erster Start mit Schlüsselbund: bisheriges Secret wird Key 1
+            db.session.add(HlsKey(secret=fallback_secret))
+            db.session.commit()
+            keys = HlsKey.query.order_by(HlsKey.id.desc()).all()
+        return tuple(
+            (k.id, k.secret.encode(),
+             timegm(k.retires_at.timetuple()) if k.retires_at else None)
+            for k in keys
+        )
+
+    def reload(self, publish: bool = False, config: bool = True) -> SettingsSnapshot:
+        with self._lock:
+            if config:
+                self._load_config()
+            self._version += 1
+            snap = SettingsSnapshot(version=self._version, config=self._config,
+                                    **self._load_setting())
+            self._snapshot = snap
+            self.reloads += 1
+
+        for listener in self._listeners:
+            try:
+                listener(snap)
+            except Exception:
+                log.exception("Settings-Listener fehlgeschlagen")
+        if publish:
+            CLUSTER.publish("settings")
+        return snap
+
+    @property
+    def current(self) -> SettingsSnapshot:
+        snap = self._snapshot
+        if snap is None or self._config_changed():
+            snap = self.reload()
+        return snap
+
+    @property
+    def version(self) -> int:
+        return self.current.version
+
+    def on_change(self, listener) -> None:
+        self._listeners.append(listener)
+
+    # -- Schreiben --------------------------------------------------------
+    def update(self, **values) -> SettingsSnapshot:
+        """Schreibt Felder der ``Setting``-Zeile und verteilt den neuen Stand."""
+        unknown = set(values) - set(SETTING_FIELDS)
+        if unknown:
+            raise KeyError(", ".join(sorted(unknown)))
+        row = Setting.query.first() or Setting()
+        for name, value in values.items():
+            setattr(row, name, value)
+        db.session.add(row)
+        db.session.commit()
+        return self.reload(publish=True, config=False)
+
+    def rotate_hls_secret(self, secret: str, grace: int) -> SettingsSnapshot:
+        """Neuer Signier-Key; bisherige bleiben noch ``grace`` Sekunden gültig."""
+        now = datetime.utcnow()
+        HlsKey.query.filter(HlsKey.retires_at.isnot(None),
+                            HlsKey.retires_at < now).delete(synchronize_session=False)
+        HlsKey.query.filter(HlsKey.retires_at.is_(None)).update(
+            {"retires_at": now + timedelta(seconds=grace)}, synchronize_session=False)
+        db.session.add(HlsKey(secret=secret))
+        return self.update(hls_secret=secret)
+
+    def update_config(self, section: str, **values) -> SettingsSnapshot:
+        """Schreibt Werte in config.cfg (atomar) und verteilt den neuen Stand."""
+        with self._lock:
+            parser = ConfigParser(interpolation=None)
+            parser.read(self.path)
+            if not parser.has_section(section):
+                parser.add_section(section)
+            for key, value in values.items():
+                parser.set(section, key, value)
+            self._write_config(parser)
+        return self.reload(publish=True)
+
+    def remove_config_section(self, section: str) -> None:
+        with self._lock:
+            parser = ConfigParser(interpolation=None)
+            parser.read(self.path)
+            if not parser.remove_section(section):
+                return
+            self._write_config(parser)
+        self.reload(publish=True)
+
+    def _write_config(self, parser: ConfigParser) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".config-", suffix=".cfg")
+        try:
+            with os.fdopen(fd, "w") as fh:
+                parser.write(fh)
+            if os.path.exists(self.path):
+                os.chmod(tmp, os.stat(self.path).st_mode & 0o777)
+            os.replace(tmp, self.path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    def stats(self) -> dict:
+        return {
+            "version":   self._version,
+            "reloads":   self.reloads,
+            "listeners": len(self._listeners),
+        }
+
+SETTINGS = SettingsService()
+
+# Andere Worker haben gespeichert → neu laden, ohne erneut zu verteilen
+CLUSTER.subscribe("settings", lambda _p: SETTINGS.reload())
@@ -1,139 +1,179 @@
 # shop.py
 from __future__ import annotations
 
-from flask import Blueprint, jsonify, request, session, current_app
+import hashlib
+import json
+import threading
+
+from flask import Blueprint, Response, jsonify, request, session, current_app
 from auth   import login_required
-from models import db, User, Setting
-from smilies import get_all_smilies
+from settings import SETTINGS
+from smilies import get_all_smilies, SMILIE_CATALOG
+from presence import PRESENCE
+from user_cache import USER_CACHE
+from ledger import LEDGER, LedgerConflict
+from inventory import add_effect, add_smilie
 
 shop_bp = Blueprint("shop", __name__, url_prefix="/shop")
 
-def _all_items(kind: str) -> dict[str, int] | list[str]:
-
+COLORS: dict[str, int] = {
+    "#ff4444": 200,
+    "#44ff44": 200,
+    "#4488ff": 250,
+    "#ff44ff": 200,
+    "#ffa500": 150,
+
+    "#E51A4C": 180,  # Crimson
+    "#FF5A4D": 170,  # Flamingo
+    "#FF8A00": 160,  # Orange Peel
+    "#C0FF00": 150,  # Lime Punch
+    "#17E8B2": 150,  # Aqua Mint
+    "#1899FF": 160,  # Dodger Blue
+    "#3B3BFF": 170,  # Ultramarine
+    "#8C00FF": 180,  # Electric Violet
+
+    "#F4C0CB": 120,  # Powder Pink
+    "#FFC9A3": 120,  # Peach Fuzz
+    "#FAD97A": 110,  # Sunray
+    "#CFFAE4": 110,  # Mint Cream
+    "#B9DBFF": 120,  # Baby Blue
+    "#D7C9FF": 120,  # Lavender Fog
+    "#D8F5C8": 110,  # Tea Green
+    "#E9D7F4": 110,  # Misty Lilac
+
+    "#FF0090": 200,  # Neon Pink
+    "#E8FF00": 190,  # Laser Lemon
+    "#39FF14": 190,  # Toxic Green
+    "#00F6FF": 190,  # Cyber Aqua
+    "#B000FF": 200,  # Shock Purple
+    "#FF5400": 190,  # Acid Orange
+
+    "#E07A5F": 140,  # Terracotta
+    "#C6AD8F": 130,  # Sand Dune
+    "#6E8B3D": 130,  # Olive Drab
+    "#2C5E3B": 140,  # Pine Forest
+    "#3D5A80": 140,  # Denim
+    "#708090": 130,  # Slate Grey
+
+}
+
+FONTS: dict[str, int] = {
+    "Press Start 2P": 300,
+    "Roboto Slab"    : 250,
+    "Comic Neue"     : 200,
+    "VT323"          : 220,
+    "Luckiest Guy"   : 260,
+    "Lobster"        : 240,
+    "Poppins"        : 230,
+    "Source Code Pro": 210,
+    "Dancing Script": 500,
+    "Codystar": 400,
+}
+
+EFFECTS: dict[str, int] = {"rainbow":25, "pulse":25, "neon":30, "glitch":100, "sparkle":30, "shake":20, "fire":30, "blur":20, "wave": 30}
+
+KINDS = ("smilie", "color", "font", "effect")
+DEFAULT_COSTS = {"smilie": 50, "color": 200, "font": 300, "effect": 25}
+
+def _all_items(kind: str) -> dict[str, int]:
     if kind == "smilie":
         return get_all_smilies()
-
-    if kind == "color":
-        return {
-            "#ff4444": 200,
-            "#44ff44": 200,
-            "#4488ff": 250,
-            "#ff44ff": 200,
-            "#ffa500": 150,
-
-            "#E51A4C": 180,  # Crimson
-            "#FF5A4D": 170,  # Flamingo
-            "#FF8A00": 160,  # Orange Peel
-            "#C0FF00": 150,  # Lime Punch
-            "#17E8B2": 150,  # Aqua Mint
-            "#1899FF": 160,  # Dodger Blue
-            "#3B3BFF": 170,  # Ultramarine
-            "#8C00FF": 180,  # Electric Violet
-
-            "#F4C0CB": 120,  # Powder Pink
-            "#FFC9A3": 120,  # Peach Fuzz
-            "#FAD97A": 110,  # Sunray
-            "#CFFAE4": 110,  # Mint Cream
-            "#B9DBFF": 120,  # Baby Blue
-            "#D7C9FF": 120,  # Lavender Fog
-            "#D8F5C8": 110,  # Tea Green
-            "#E9D7F4": 110,  # Misty Lilac
-
-            "#FF0090": 200,  # Neon Pink
-            "#E8FF00": 190,  # Laser Lemon
-            "#39FF14": 190,  # Toxic Green
-            "#00F6FF": 190,  # Cyber Aqua
-            "#B000FF": 200,  # Shock Purple
-            "#FF5400": 190,  # Acid Orange
-
-            "#E07A5F": 140,  # Terracotta
-            "#C6AD8F": 130,  # Sand Dune
-            "#6E8B3D": 130,  # Olive Drab
-            "#2C5E3B": 140,  # Pine Forest
-            "#3D5A80": 140,  # Denim
-            "#708090": 130,  # Slate Grey
-
-        }
-
-    if kind == "font":
-        return {
-            "Press Start 2P": 300,
-            "Roboto Slab"    : 250,
-            "Comic Neue"     : 200,
-            "VT323"          : 220,
-            "Luckiest Guy"   : 260,
-            "Lobster"        : 240,
-            "Poppins"        : 230,
-            "Source Code Pro": 210,
-            "Dancing Script": 500,
-            "Codystar": 400,
-        }
-
-    if kind == "effect":
-        return {"rainbow":25, "pulse":25, "neon":30, "glitch":100, "sparkle":30, "shake":20, "fire":30, "blur":20, "wave": 30}
-    return []
-
+    return {"color": COLORS, "font": FONTS, "effect": EFFECTS}.get(kind, {})
+
+class ShopCatalog:
+    """Vorberechneter, versionierter Shop-Katalog (Name + Preis je Kategorie).
+
+    Neu gebaut wird nur, wenn sich die Smilie-Liste (``SMILIE_CATALOG.version``)
+    oder die Einstellungen (``SETTINGS.version``) ändern. Jede Kategorie liegt
+    als fertiges JSON mit starkem ETag vor; was dem User gehört, liefert das
+    kleine Overlay separat.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key  = None
+        self._defaults: dict[str, int] = dict(DEFAULT_COSTS)
+        self._prices: dict[str, dict[str, int]] = {}
+        self._bodies: dict[str, tuple[bytes, str]] = {}
+
+        self.builds = 0
+
+    def _ensure(self) -> None:
+        setting = SETTINGS.current
+        key = (SMILIE_CATALOG.version, setting.version)
+        if key == self._key:
+            return
+        defaults = {kind: getattr(setting, f"{kind}_cost") for kind in KINDS}
+        prices = {kind: dict(_all_items(kind)) for kind in KINDS}
+        bodies = {}
+        for kind in KINDS:
+            raw = json.dumps([{"name": n, "cost": c} for n, c in prices[kind].items()],
+                             ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            bodies[kind] = (raw, hashlib.sha1(raw).hexdigest())
+        with self._lock:
+            self._defaults, self._prices, self._bodies = defaults, prices, bodies
+            self._key = key
+            self.builds += 1
+
+    def price(self, kind: str, item: str | None = None) -> int:
+        self._ensure()
+        return self._prices[kind].get(item, self._defaults[kind])
+
+    def items(self, kind: str) -> dict[str, int]:
+        self._ensure()
+        return self._prices[kind]
+
+    def body(self, kind: str) -> tuple[bytes, str]:
+        self._ensure()
+        return self._bodies[kind]
+
+CATALOG = ShopCatalog()
 
 def _cost(kind: str, item: str | None = None) -> int:
+    return CATALOG.price(kind, item)
 
-    items = _all_items(kind)
-    if isinstance(items, dict) and item in items:
-        return items[item]
-
-    setting  = Setting.query.first()
-    defaults = {"smilie": 50, "color": 200, "font": 300, "effect": 25}
-    if not setting:
-        return defaults[kind]
-
-    return {
-        "smilie": getattr(setting, "smilie_cost", defaults["smilie"]),
-        "color" : getattr(setting, "color_cost" , defaults["color"]),
-        "font"  : getattr(setting, "font_cost"  , defaults["font"]),
-        "effect": getattr(setting, "effect_cost", defaults["effect"]),
-    }[kind]
+def _overlay(kind: str, user) -> dict:
+    if kind == "color":
+        return {"active": user.color}
+    if kind == "font":
+        return {"active": user.font or ""}
+    if kind == "smilie":
+        return {"unlocked": list(user.unlocked_smilies)}
+    return {}
 
 @shop_bp.route("/catalog/<kind>")
 @login_required
 def catalog(kind: str):
-    if kind not in ("smilie", "color", "font", "effect"):
+    """Statischer Teil: für alle gleich, per ETag/304 von Browser und nginx cachebar."""
+    if kind not in KINDS:
         return jsonify([])
 
-    user   = User.query.filter_by(username=session["username"]).first()
-    items  = _all_items(kind)
-
-    if kind in ("color", "font"):
-        active = user.color if kind == "color" else (user.font or "")
-        names  = items.keys() if isinstance(items, dict) else items
-        return jsonify([
-            {
-                "name" : n,
-                "cost" : (items[n] if isinstance(items, dict) else _cost(kind, n)),
-                "active": (n == active),
-            }
-            for n in names
-        ])
-
-    unlocked = [] if kind == "effect" else getattr(user, f"unlocked_{kind}s", [])
-    names    = items.keys() if isinstance(items, dict) else items
-    return jsonify([
-        {
-            "name"    : n,
-            "cost"    : (items[n] if isinstance(items, dict) else _cost(kind, n)),
-            "unlocked": n in unlocked,
-        }
-        for n in names
-    ])
+    raw, etag = CATALOG.body(kind)
+    resp = Response(raw, mimetype="application/json")
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "public, no-cache"
+    return resp.make_conditional(request)
+
+@shop_bp.route("/overlay/<kind>")
+@login_required
+def overlay(kind: str):
+    """Was der aktuelle User davon besitzt bzw. aktiv hat."""
+    if kind not in KINDS:
+        return jsonify({})
+    resp = jsonify(_overlay(kind, USER_CACHE.get(session["username"])))
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
 
 @shop_bp.route("/inventory/effect")
 @login_required
 def inventory_effect():
-    user = User.query.filter_by(username=session["username"]).first()
+    user = USER_CACHE.get(session["username"])
     return jsonify(user.effect_inventory or {})
 
 @shop_bp.route("/buy/color", methods=["POST"])
 @login_required
 def buy_color():
-    user  = User.query.filter_by(username=session["username"]).first()
+    user  = USER_CACHE.get(session["username"])
     color = (request.get_json(force=True) or {}).get("item")
 
     if color not in _all_items("color"):
@@ -142,12 +182,11 @@ def buy_color():
         return jsonify(success=False, message="Farbe bereits aktiv"), 400
 
     price = _cost("color", color)
-    if user.points < price:
+    user  = LEDGER.apply(user.username, -price, "color", item=color, color=color)
+    if user is None:
         return jsonify(success=False, message="Zu wenig Münzen!"), 400
 
-    user.points -= price
-    user.color   = color
-    db.session.commit()
+    PRESENCE.set_color(user.username, user.color)
 
     current_app.extensions["socketio"].emit("user_data_changed", {
         "username": user.username, "color": user.color, "points": user.points
@@ -158,7 +197,7 @@ def buy_color():
 @shop_bp.route("/buy/font", methods=["POST"])
 @login_required
 def buy_font():
-    user = User.query.filter_by(username=session["username"]).first()
+    user = USER_CACHE.get(session["username"])
     font = (request.get_json(force=True) or {}).get("item")
 
     if font not in _all_items("font"):
@@ -167,12 +206,10 @@ def buy_font():
         return jsonify(success=False, message="Schrift bereits aktiv"), 400
 
     price = _cost("font", font)
-    if user.points < price:
+    user  = LEDGER.apply(user.username, -price, "font", item=font, font=font)
+    if user is None:
         return jsonify(success=False, message="Zu wenig Münzen!"), 400
 
-    user.points -= price
-    user.font    = font
-    db.session.commit()
 
     current_app.extensions["socketio"].emit("user_data_changed", {
         "username": user.username, "font": user.font, "points": user.points
@@ -186,43 +223,45 @@ def buy(kind: str):
     if kind not in ("smilie", "effect"):
         return jsonify(success=False, message="Ungültige Kategorie"), 400
 
-    user = User.query.filter_by(username=session["username"]).first()
+    user = USER_CACHE.get(session["username"])
     item = (request.get_json(force=True) or {}).get("item")
     if not item:
         return jsonify(success=False, message="Item fehlt"), 400
 
-    if kind != "effect" and item in getattr(user, f"unlocked_{kind}s"):
+    if kind != "effect" and item in user.unlocked:
         return jsonify(success=False, message="Schon freigeschaltet!"), 400
 
-    price = _cost(kind, item)
-    if user.points < price:
+    price   = _cost(kind, item)
+    user_id = user.id
+    grant   = (lambda: add_effect(user_id, item)) if kind == "effect" \
+              else (lambda: add_smilie(user_id, item))
+
+    try:
+        user = LEDGER.apply(user.username, -price, kind, item=item, extra=grant)
+    except LedgerConflict:
+        if kind != "effect":
+            return jsonify(success=False, message="Schon freigeschaltet!"), 400
+        # paralleler Erstkauf desselben Effekts – die Zeile gibt es jetzt
+        user = LEDGER.apply(user.username, -price, kind, item=item, extra=grant)
+    if user is None:
         return jsonify(success=False, message="Nicht genug Punkte!"), 400
 
-    user.points -= price
-    if kind == "effect":
-        inv = user.effect_inventory
-        inv[item] = inv.get(item, 0) + 1
-    else:
-        getattr(user, f"unlocked_{kind}s").append(item)
-
-    db.session.commit()
     return jsonify(success=True, new_points=user.points)
 
 @shop_bp.route("/unlocked_smilies")
 @login_required
 def unlocked_smilies():
-    user = User.query.filter_by(username=session["username"]).first()
-    return jsonify(user.unlocked_smilies if user else [])
+    user = USER_CACHE.get(session["username"])
+    return jsonify(list(user.unlocked_smilies) if user else [])
 
 @shop_bp.route("/smilies")
 @login_required
 def smilie_catalogue():
-    user     = User.query.filter_by(username=session["username"]).first()
-    unlocked = set(user.unlocked_smilies) if user else set()
-    names    = _all_items("smilie")
+    user     = USER_CACHE.get(session["username"])
+    unlocked = user.unlocked if user else frozenset()
     return jsonify([
-        {"name": s, "cost": _cost("smilie", s), "unlocked": s in unlocked}
-        for s in names
+        {"name": s, "cost": cost, "unlocked": s in unlocked}
+        for s, cost in CATALOG.items("smilie").items()
     ])
 
 @shop_bp.route("/unlock", methods=["POST"])
@@ -1,7 +1,12 @@
 from __future__ import annotations
 
+import hashlib
 import json
 import os
+import re
+import tempfile
+import threading
+import time
 from pathlib import Path
 from typing import Dict
 
@@ -14,34 +19,139 @@ def _json_path() -> Path:
 def _smilie_dir() -> Path:
     return Path(current_app.static_folder, "smilie")
 
-def get_all_smilies() -> Dict[str, int]:
-    p = _json_path()
-    if not p.exists():
-        return {}
+TAG_RE = re.compile(r":(\w+):")
 
-    try:
-        data = json.loads(p.read_text(encoding="utf-8")) or {}
-        smilies = data.get("smilies", {})
+class SmilieCatalog:
+    """Hält smilies.json im Speicher und liest sie nur bei Änderungen neu.
+
+    Die Datei wird höchstens einmal pro ``check_interval`` per stat geprüft; neu
+    geparst wird nur, wenn sich mtime *und* Inhalts-Hash geändert haben.
+    Schreibzugriffe laufen atomar über eine Temp-Datei + ``os.replace``.
+    """
+
+    def __init__(self, check_interval: float = 1.0):
+        self.check_interval = check_interval
+        self.version = 0
+
+        self._lock    = threading.RLock()
+        self._data: dict = {}
+        self._prices: Dict[str, int] = {}
+        self._names: frozenset[str] = frozenset()
+        self._mtime: float | None = None
+        self._digest: str | None = None
+        self._checked = 0.0
+
+    def _default_price(self) -> int:
+        try:
+            from settings import SETTINGS
+
+            return int(SETTINGS.current.smilie_cost)
+        except Exception:
+            return 50
 
+    def _apply(self, data: dict) -> None:
+        smilies = data.get("smilies", {})
         if isinstance(smilies, list):
-            default_price = 50
+            # Altes Listenformat: nur im Speicher umwandeln, nicht beim Lesen schreiben
+            default_price = self._default_price()
+            smilies = {n: default_price for n in smilies}
+        prices = {str(k): int(v) for k, v in smilies.items()}
+
+        self._data   = data
+        self._prices = prices
+        self._names  = frozenset(prices)
+        self.version += 1
+
+    def _refresh(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._checked < self.check_interval:
+            return
+
+        with self._lock:
+            self._checked = now
+            p = _json_path()
             try:
-                from models import Setting
+                mtime = p.stat().st_mtime
+            except OSError:
+                if self._mtime is not None or self._digest is None:
+                    self._mtime, self._digest = None, ""
+                    self._apply({})
+                return
+
+            if mtime == self._mtime and not force:
+                return
 
-                setting = Setting.query.first()
-                if setting and getattr(setting, "smilie_cost", None) is not None:
-                    default_price = int(setting.smilie_cost)
+            try:
+                raw = p.read_bytes()
+                digest = hashlib.sha1(raw).hexdigest()
+                if digest != self._digest:
+                    self._apply(json.loads(raw.decode("utf-8")) or {})
+                    self._digest = digest
+                self._mtime = mtime
             except Exception:
-                pass
+                # Kaputte Datei: letzten gültigen Stand behalten
+                self._mtime = mtime
 
-            smilies = {n: default_price for n in smilies}
+    def _write(self, data: dict) -> None:
+        p = _json_path()
+        raw = json.dumps(data, indent=2, ensure_ascii=False).encode("utf-8")
+        fd, tmp = tempfile.mkstemp(dir=p.parent, prefix=".smilies-", suffix=".json")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(raw)
+            os.chmod(tmp, p.stat().st_mode & 0o777 if p.exists() else 0o644)
+            os.replace(tmp, p)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+
+        self._apply(data)
+        self._digest = hashlib.sha1(raw).hexdigest()
+        self._mtime  = p.stat().st_mtime
+
+    def prices(self) -> Dict[str, int]:
+        """Name → Preis. Das Dict wird nie verändert, nur ersetzt."""
+        self._refresh()
+        return self._prices
+
+    def names(self) -> frozenset[str]:
+        self._refresh()
+        return self._names
+
+    def tags_in(self, text: str) -> list[str]:
+        """Alle ``:tag:`` im Text, die einen bekannten Smilie bezeichnen."""
+        names = self.names()
+        return [t for t in TAG_RE.findall(text) if t in names]
+
+    def update(self, prices: Dict[str, int], default_price: int | None = None) -> None:
+        with self._lock:
+            self._refresh(force=True)
+            data = dict(self._data)
+            smilies = data.get("smilies", {})
+            if isinstance(smilies, list):
+                fallback = default_price if default_price is not None else self._default_price()
+                smilies = {n: fallback for n in smilies}
+            smilies = {**smilies, **prices}
             data["smilies"] = smilies
-            p.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8")
+            self._write(data)
 
-        return {str(k): int(v) for k, v in smilies.items()}
+    def remove(self, name: str) -> bool:
+        with self._lock:
+            self._refresh(force=True)
+            smilies = self._data.get("smilies", {})
+            if isinstance(smilies, list):
+                smilies = {n: 50 for n in smilies}
+            if name not in smilies:
+                return False
+            data = dict(self._data)
+            data["smilies"] = {k: v for k, v in smilies.items() if k != name}
+            self._write(data)
+            return True
 
-    except Exception:
-        return {}
+SMILIE_CATALOG = SmilieCatalog()
+
+def get_all_smilies() -> Dict[str, int]:
+    return SMILIE_CATALOG.prices()
 
 def handle_smilie_upload():
     file = request.files.get("smilie_file")
@@ -74,17 +184,8 @@ def handle_smilie_upload():
         flash(f"Fehler beim Speichern: {e}", "error")
         return redirect(url_for("admin_panel"))
 
-    p = _json_path()
     try:
-        data: dict = {}
-        if p.exists():
-            data = json.loads(p.read_text(encoding="utf-8"))
-        smilies = data.get("smilies", {})
-        if isinstance(smilies, list):
-            smilies = {n: price for n in smilies}
-        smilies[name] = price
-        data["smilies"] = smilies
-        p.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8")
+        SMILIE_CATALOG.update({name: price}, default_price=price)
     except Exception as e:
         flash(f"Fehler beim Schreiben der JSON‑Datei: {e}", "error")
         return redirect(url_for("admin_panel"))
@@ -103,16 +204,7 @@ def update_smilie_prices():
             flash("Keine Preis‑Änderungen erkannt!", "info")
             return redirect(url_for("admin_panel"))
 
-        p = _json_path()
-        data: dict = {}
-        if p.exists():
-            data = json.loads(p.read_text(encoding="utf-8"))
-        smilies = data.get("smilies", {})
-        if isinstance(smilies, list):
-            smilies = {n: 50 for n in smilies}
-        smilies.update(updates)
-        data["smilies"] = smilies
-        p.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8")
+        SMILIE_CATALOG.update(updates, default_price=50)
 
         flash("Smilie‑Preise aktualisiert ✔", "success")
         return redirect(url_for("admin_panel"))
@@ -136,17 +228,8 @@ def delete_smilie(name: str):
             flash(f"Fehler beim Löschen der Datei: {e}", "error")
             return redirect(url_for("admin_panel"))
 
-    p = _json_path()
     try:
-        if p.exists():
-            data = json.loads(p.read_text(encoding="utf-8"))
-            smilies = data.get("smilies", {})
-            if isinstance(smilies, list):
-                smilies = {n: 50 for n in smilies}
-            if name in smilies:
-                smilies.pop(name, None)
-                data["smilies"] = smilies
-                p.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8")
+        SMILIE_CATALOG.remove(name)
     except Exception as e:
         flash(f"Fehler beim Aktualisieren der JSON‑Datei: {e}", "error")
         return redirect(url_for("admin_panel"))
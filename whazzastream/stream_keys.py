@@ -0,0 +1,145 @@
+# stream_keys.py
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+
+from cluster import CLUSTER
+from models import StreamKey
+
+log = logging.getLogger(__name__)
+
+HASH_PREFIX = "sha256:"
+
+def hash_stream_key(key: str) -> str:
+    """Stream-Keys landen nur gehasht in der DB (``StreamKey.key``)."""
+    return HASH_PREFIX + hashlib.sha256(key.encode()).hexdigest()
+
+def is_hashed(value: str) -> bool:
+    return value.startswith(HASH_PREFIX)
+
+class StreamKeyIndex:
+    """Gültige Stream-Keys als Hash-Menge im Speicher.
+
+    ``on_publish`` von nginx-rtmp prüft nur noch gegen diese Menge – ohne
+    DB-Zugriff, ein OBS-Reconnect-Loop kostet damit nichts und Publishen
+    klappt auch, wenn die DB kurz weg ist. Änderungen aus dem Admin-Panel
+    gehen als Delta über den Cluster-Bus; ``refresh`` gleicht zusätzlich
+    periodisch mit der DB ab und behält bei Fehlern den letzten Stand.
+
+    Publish-Versuche werden pro Client-Adresse gezählt: mehr als ``limit``
+    in ``window`` Sekunden werden abgewiesen, bevor überhaupt geprüft wird.
+    """
+
+    def __init__(self, refresh_interval: float = 60, limit: int = 10,
+                 window: float = 60, max_clients: int = 1000):
+        self.refresh_interval = refresh_interval
+        self.limit       = limit
+        self.window      = window
+        self.max_clients = max_clients
+
+        self.app = None
+        self._hashes: frozenset[str] = frozenset()
+        self._loaded = False
+        self._attempts: OrderedDict[str, deque] = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.allowed   = 0
+        self.denied    = 0
+        self.throttled = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+        CLUSTER.subscribe("stream_keys", self._on_cluster)
+
+    def init_app(self, app) -> None:
+        self.app = app
+
+    # -- Bestand ----------------------------------------------------------
+    def refresh(self) -> bool:
+        try:
+            with self.app.app_context():
+                hashes = frozenset(k for (k,) in StreamKey.query.with_entities(StreamKey.key)
+                                   if is_hashed(k))
+        except Exception:
+            self.refresh_errors += 1
+            log.warning("Stream-Keys nicht geladen – %d bekannte bleiben gültig",
+                        len(self._hashes), exc_info=True)
+            return False
+        with self._lock:
+            self._hashes = hashes
+            self._loaded = True
+        self.refreshes += 1
+        return True
+
+    def _apply(self, add: str | None = None, remove: str | None = None) -> None:
+        with self._lock:
+            hashes = set(self._hashes)
+            if add:
+                hashes.add(add)
+            if remove:
+                hashes.discard(remove)
+            self._hashes = frozenset(hashes)
+
+    def added(self, key_hash: str) -> None:
+        self._apply(add=key_hash)
+        CLUSTER.publish("stream_keys", {"add": key_hash})
+
+    def removed(self, key_hash: str) -> None:
+        self._apply(remove=key_hash)
+        CLUSTER.publish("stream_keys", {"remove": key_hash})
+
+    def _on_cluster(self, payload: dict) -> None:
+        self._apply(add=payload.get("add"), remove=payload.get("remove"))
+
+    # -- on_publish -------------------------------------------------------
+    def _throttled(self, client: str) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            hits = self._attempts.get(client)
+            if hits is None:
+                hits = self._attempts[client] = deque()
+                while len(self._attempts) > self.max_clients:
+                    self._attempts.popitem(last=False)
+            self._attempts.move_to_end(client)
+            while hits and hits[0] <= now - self.window:
+                hits.popleft()
+            if len(hits) >= self.limit:
+                return True
+            hits.append(now)
+            return False
+
+    def check(self, key: str, client: str = "-") -> bool:
+        if self._throttled(client):
+            self.throttled += 1
+            return False
+        if not self._loaded:
+            self.refresh()
+        ok = bool(key) and hash_stream_key(key) in self._hashes
+        if ok:
+            self.allowed += 1
+        else:
+            self.denied += 1
+        return ok
+
+    def start(self, socketio) -> None:
+        self.refresh()
+        socketio.start_background_task(self._run, socketio)
+
+    def _run(self, socketio) -> None:
+        while True:
+            socketio.sleep(self.refresh_interval)
+            self.refresh()
+
+    def stats(self) -> dict:
+        return {
+            "keys":           len(self._hashes),
+            "allowed":        self.allowed,
+            "denied":         self.denied,
+            "throttled":      self.throttled,
+            "refreshes":      self.refreshes,
+            "refresh_errors": self.refresh_errors,
+        }
+
+STREAM_KEYS = StreamKeyIndex()
@@ -0,0 +1,158 @@
+# stream_state.py
+import logging
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from cluster import CLUSTER
+from stream_keys import hash_stream_key
+
+log = logging.getLogger(__name__)
+
+# nginx-rtmp schreibt die Playlist beim Stoppen noch einmal – so lange nach
+# dem Ende zählt ein frisches Last-Modified nicht als neuer Stream
+END_GRACE = 2
+
+class StreamState:
+    """Ist der Stream live? Getrieben von den nginx-rtmp-Callbacks
+    (``on_publish``/``on_publish_done``), abgesichert durch einen Watcher,
+    der prüft, ob die Playlist noch frisch geschrieben wird. Der Watcher
+    läuft nur auf Worker 0, sonst meldete jeder Worker denselben Wechsel.
+
+    Änderungen gehen als ``stream_state`` an alle Clients und über den
+    Cluster-Bus an die anderen Worker – ``live`` ist damit überall O(1).
+    Vom Stream-Key wird nur der Hash gehalten (wie in ``StreamKey.key``),
+    weder Bus noch ``/admin/metrics`` sehen den Klartext.
+    """
+
+    def __init__(self, interval: float = 5, stale_after: float = 10):
+        self.interval    = interval
+        self.stale_after = stale_after
+
+        self.live  = False
+        self.key_hash = None
+        self.since = None
+        self.ended_at = None
+        self.last_segment = None
+
+        self.playlist = None   # z. B. "whazzaStream.m3u8"
+        self.client   = None   # hls_cache.UpstreamClient (signiert selbst)
+
+        self._lock = threading.Lock()
+        self._socketio = None
+        self._listeners = []
+
+        self.transitions = 0
+        self.checks      = 0
+        self.check_errors = 0
+
+        CLUSTER.subscribe("stream", self._on_cluster)
+
+    def snapshot(self) -> dict:
+        return {"live": self.live, "since": self.since}
+
+    def _set(self, live: bool, key_hash: str | None, source: str) -> bool:
+        with self._lock:
+            if live == self.live:
+                if live and key_hash:
+                    self.key_hash = key_hash
+                return False
+            self.live  = live
+            self.key_hash = key_hash if live else None
+            self.since = int(time.time()) if live else None
+            self.ended_at = None if live else time.time()
+            self.transitions += 1
+
+        log.info("Stream %s (%s)", "live" if live else "offline", source)
+        CLUSTER.publish("stream", {"live": self.live, "key_hash": self.key_hash,
+                                   "since": self.since, "ended_at": self.ended_at})
+        if self._socketio:
+            self._socketio.emit("stream_state", self.snapshot())
+        # nur auf dem Worker, der den Wechsel erkannt hat – nicht per Cluster
+        for listener in self._listeners:
+            try:
+                listener(self.live, key_hash)
+            except Exception:
+                log.exception("Stream-Listener fehlgeschlagen")
+        return True
+
+    def on_change(self, listener) -> None:
+        """``listener(live, key_hash)`` nach jedem lokal erkannten Wechsel."""
+        self._listeners.append(listener)
+
+    def _on_cluster(self, payload: dict) -> None:
+        with self._lock:
+            self.live  = payload["live"]
+            self.key_hash = payload.get("key_hash")
+            self.since = payload.get("since")
+            self.ended_at = payload.get("ended_at")
+            if self.live:
+                # Schonfrist für den Watcher auf Worker 0, wenn der Publish
+                # bei einem anderen Worker ankam
+                self.last_segment = max(self.last_segment or 0, self.since or 0)
+
+    def on_publish(self, name: str) -> None:
+        self.last_segment = time.time()
+        self._set(True, hash_stream_key(name), "publish")
+
+    def on_done(self, name: str) -> None:
+        if self.key_hash in (None, hash_stream_key(name)):
+            self._set(False, None, "publish_done")
+
+    def _segment_age(self) -> float | None:
+        """Alter des jüngsten Segments – die Playlist wird mit jedem neuen
+        Segment neu geschrieben, ihr Last-Modified reicht also."""
+        r = self.client.get(self.playlist)
+        try:
+            if r.status_code != 200:
+                return None
+            modified = r.headers.get("Last-Modified")
+            if not modified:
+                return 0.0
+            return time.time() - parsedate_to_datetime(modified).timestamp()
+        finally:
+            r.close()
+
+    def check(self) -> None:
+        if not (self.client and self.playlist):
+            return
+        self.checks += 1
+        try:
+            age = self._segment_age()
+        except Exception:
+            self.check_errors += 1
+            log.warning("Stream-Watcher: Playlist nicht erreichbar", exc_info=True)
+            return
+
+        fresh = age is not None and age < self.stale_after
+        if fresh and not self.live and self.ended_at \
+                and time.time() - age <= self.ended_at + END_GRACE:
+            # letzte Playlist vom Stoppen, kein neuer Stream
+            fresh = False
+        if fresh:
+            self.last_segment = time.time() - age
+            self._set(True, self.key_hash, "watcher")
+        elif self.live and time.time() - (self.last_segment or 0) >= self.stale_after:
+            self._set(False, None, "watcher")
+
+    def start(self, socketio, watch: bool = True) -> None:
+        self._socketio = socketio
+        if watch:
+            socketio.start_background_task(self._run)
+
+    def _run(self) -> None:
+        while True:
+            self._socketio.sleep(self.interval)
+            self.check()
+
+    def stats(self) -> dict:
+        return {
+            **self.snapshot(),
+            "key_hash":     self.key_hash,
+            "last_segment": self.last_segment,
+            "transitions":  self.transitions,
+            "checks":       self.checks,
+            "check_errors": self.check_errors,
+        }
+
+STREAM = StreamState()
@@ -0,0 +1,133 @@
+# user_cache.py
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
+from datetime import date, datetime
+
+from cluster import CLUSTER
+from models import User
+
+@dataclass(frozen=True)
+class UserState:
+    """Unveränderlicher Schnappschuss der heißen User-Felder."""
+
+    id               : int
+    username         : str
+    color            : str
+    font             : str | None
+    points           : int
+    unlocked_smilies : tuple[str, ...]
+    effect_inventory : dict
+    is_active        : bool
+    is_admin         : bool
+    last_daily_bonus : date | None     = None
+    last_stream_bonus: datetime | None = None
+    unlocked         : frozenset[str]  = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "unlocked", frozenset(self.unlocked_smilies))
+
+    @classmethod
+    def from_model(cls, user: User) -> "UserState":
+        return cls(
+            id=user.id,
+            username=user.username,
+            color=user.color or "#000000",
+            font=user.font,
+            points=user.points or 0,
+            unlocked_smilies=tuple(sorted(s.smilie for s in user.smilies)),
+            effect_inventory={e.effect: e.count for e in user.effects},
+            is_active=bool(user.is_active),
+            is_admin=bool(user.is_admin),
+            last_daily_bonus=user.last_daily_bonus,
+            last_stream_bonus=user.last_stream_bonus,
+        )
+
+class UserCache:
+    """LRU-Cache für UserState. Geschrieben wird woanders (``LEDGER.apply``,
+    Admin-Routen); danach ``invalidate`` bzw. ``put``."""
+
+    def __init__(self, max_size: int = 1000):
+        self.max_size = max_size
+        self._entries: OrderedDict[str, UserState] = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits      = 0
+        self.misses    = 0
+        self.evictions = 0
+
+    def _store(self, state: UserState) -> None:
+        with self._lock:
+            self._entries[state.username] = state
+            self._entries.move_to_end(state.username)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get(self, username: str | None) -> UserState | None:
+        if not username:
+            return None
+        with self._lock:
+            state = self._entries.get(username)
+            if state is not None:
+                self._entries.move_to_end(username)
+                self.hits += 1
+                return state
+            self.misses += 1
+
+        user = User.query.filter_by(username=username).first()
+        if not user:
+            return None
+        state = UserState.from_model(user)
+        self._store(state)
+        return state
+
+    def put(self, username: str, **changes) -> UserState | None:
+        """Nur den Cache nachziehen – der Aufrufer hat die DB schon geschrieben."""
+        with self._lock:
+            state = self._entries.get(username)
+        CLUSTER.publish("user", {"username": username})
+        if state is None:
+            return self.get(username)
+        state = replace(state, **changes)
+        self._store(state)
+        return state
+
+    def invalidate(self, username: str, publish: bool = True) -> None:
+        with self._lock:
+            self._entries.pop(username, None)
+        if publish:
+            CLUSTER.publish("user", {"username": username})
+
+    def invalidate_many(self, usernames) -> None:
+        """Nach Bulk-Updates: ein Cluster-Event statt eines pro User."""
+        usernames = list(usernames)
+        with self._lock:
+            for name in usernames:
+                self._entries.pop(name, None)
+        if usernames:
+            CLUSTER.publish("user", {"usernames": usernames})
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size":      len(self._entries),
+            "max_size":  self.max_size,
+            "hits":      self.hits,
+            "misses":    self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+USER_CACHE = UserCache()
+
+# Andere Worker haben geschrieben → lokale Kopie verwerfen
+def _on_cluster_user(payload: dict) -> None:
+    for name in payload.get("usernames") or [payload["username"]]:
+        USER_CACHE.invalidate(name, publish=False)
+
+CLUSTER.subscribe("user", _on_cluster_user)
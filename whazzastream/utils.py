@@ -1,43 +1,34 @@
 # utils.py
-from models import db, User, Setting 
+from models import db, User
 from werkzeug.security import generate_password_hash, check_password_hash
 from sqlalchemy.exc import IntegrityError
 import time, hmac, hashlib
-from functools import lru_cache
-import secrets
-
-@lru_cache
-def _hls_secret() -> bytes:
-    s = Setting.query.first()
-
-    if not s:
-        s = Setting()
-        db.session.add(s)
-
-    if not s.hls_secret:
-        s.hls_secret = secrets.token_urlsafe(32)
-        db.session.commit()
-
-    return s.hls_secret.encode()
-
-def clear_hls_secret_cache():
-    _hls_secret.cache_clear()
+from concurrency import BLOCKING
+from settings import SETTINGS
 
 def generate_hls_token(username: str, expires_in: int = 60) -> str:
+    """Signiert mit dem neuesten Key; die Key-ID steht im Token."""
+    kid, secret, _ = SETTINGS.current.hls_keys[0]
     expiry = int(time.time()) + expires_in
-    msg = f"{username}:{expiry}".encode()
-    signature = hmac.new(_hls_secret(), msg, hashlib.sha256).hexdigest()
-    return f"{expiry}:{signature}"
+    msg = f"{username}:{expiry}:{kid}".encode()
+    signature = hmac.new(secret, msg, hashlib.sha256).hexdigest()
+    return f"{expiry}:{kid}:{signature}"
 
 def validate_hls_token(username: str, token: str) -> bool:
     try:
-        expiry, signature = token.split(":")
-        expiry = int(expiry)
-        if expiry < time.time():
+        expiry, kid, signature = token.split(":")
+        expiry, kid = int(expiry), int(kid)
+        now = time.time()
+        if expiry < now:
             return False
-        msg = f"{username}:{expiry}".encode()
-        expected = hmac.new(_hls_secret(), msg, hashlib.sha256).hexdigest()
-        return hmac.compare_digest(expected, signature)
+        for key_id, secret, retires in SETTINGS.current.hls_keys:
+            if key_id == kid:
+                if retires is not None and retires < now:
+                    return False
+                msg = f"{username}:{expiry}:{kid}".encode()
+                expected = hmac.new(secret, msg, hashlib.sha256).hexdigest()
+                return hmac.compare_digest(expected, signature)
+        return False
     except Exception:
         return False
 
@@ -63,9 +54,10 @@ def delete_user(username):
         db.session.delete(user)
         db.session.commit()
 
-def check_login(username, password) -> bool:
-    user = User.query.filter_by(username=username).first()
-    return bool(user and user.is_active and check_password_hash(user.password, password))
+def check_login(user, password) -> bool:
+    """Prüft das Passwort eines bereits geladenen Users im Worker-Pool."""
+    return bool(user and user.is_active
+                and BLOCKING.run(check_password_hash, user.password, password))
 
 
 def update_user_password(username, new_password) -> bool:
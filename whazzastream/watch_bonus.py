@@ -0,0 +1,129 @@
+# watch_bonus.py
+import logging
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, or_, select, update
+
+from models import db, User
+from presence import PRESENCE
+from settings import SETTINGS
+from stream_state import STREAM
+from ledger import LEDGER
+from user_cache import USER_CACHE
+
+log = logging.getLogger(__name__)
+
+def stream_bonus_due(cutoff: datetime):
+    """Wer seit ``cutoff`` keinen Zuschau-Bonus bekommen hat – für Bulk-Lauf
+    und Heartbeat dieselbe Bedingung."""
+    return or_(User.last_stream_bonus.is_(None), User.last_stream_bonus <= cutoff)
+
+class WatchBonus:
+    """Zuschau-Bonus serverseitig statt per Heartbeat jedes Clients.
+
+    Alle ``tick`` Sekunden bekommen alle Online-User, deren letzter Bonus
+    älter als ``stream_bonus_interval`` Minuten ist, per Bulk-UPDATE ihre
+    ``stream_bonus_points``; die neuen Kontostände gehen als eine Liste in
+    ``user_data_changed`` raus. Läuft nur auf Worker 0 (Presence ist global).
+    """
+
+    def __init__(self, app, tick: float = 30, chunk: int = 500):
+        self.app   = app
+        self.tick  = tick
+        self.chunk = chunk
+        self._socketio = None
+
+        self.runs     = 0
+        self.credited = 0
+        self.last_ms  = 0.0
+
+    def _credit(self, names: list[str], bonus: int, cutoff: datetime,
+                now: datetime) -> list[tuple[str, int]]:
+        due = stream_bonus_due(cutoff)
+        # Zeilen sperren (MariaDB) – ein paralleler Heartbeat wartet, bis wir fertig sind
+        eligible = db.session.execute(
+            select(User.username)
+            .where(User.username.in_(names), User.is_active.is_(True), due)
+            .with_for_update()
+        ).scalars().all()
+        if not eligible:
+            db.session.rollback()
+            return []
+
+        # Bedingung erneut im UPDATE – parallele Heartbeats zahlen nicht doppelt
+        stmt = (
+            update(User)
+            .where(User.username.in_(eligible), due)
+            .values(points=func.coalesce(User.points, 0) + bonus,
+                    last_stream_bonus=now)
+            .execution_options(synchronize_session=False)
+        )
+        if db.engine.dialect.update_returning:
+            # nur was *dieses* UPDATE geändert hat
+            rows = db.session.execute(stmt.returning(User.username, User.points)).all()
+        else:
+            # MariaDB kennt kein UPDATE … RETURNING; die gesperrten Zeilen
+            # hat niemand sonst angefasst
+            db.session.execute(stmt)
+            rows = db.session.execute(
+                select(User.username, User.points).where(User.username.in_(eligible))
+            ).all()
+        db.session.commit()
+        return [(name, points) for name, points in rows]
+
+    def run_once(self) -> int:
+        if not STREAM.live:
+            return 0
+        names = sorted(PRESENCE.usernames())
+        if not names:
+            return 0
+
+        started = time.perf_counter()
+        with self.app.app_context():
+            setting  = SETTINGS.current
+            interval = setting.stream_bonus_interval or 30
+            bonus    = setting.stream_bonus_points  or 20
+
+            # DATETIME ohne Sekundenbruchteile – wie der Heartbeat
+            now    = datetime.utcnow().replace(microsecond=0)
+            cutoff = now - timedelta(minutes=interval)
+
+            credited = []
+            for i in range(0, len(names), self.chunk):
+                credited += self._credit(names[i:i + self.chunk], bonus, cutoff, now)
+
+        self.runs    += 1
+        self.last_ms  = round((time.perf_counter() - started) * 1000, 2)
+        if not credited:
+            return 0
+
+        self.credited += len(credited)
+        for name, _ in credited:
+            LEDGER.record(name, bonus, "stream")
+        USER_CACHE.invalidate_many(name for name, _ in credited)
+        self._socketio.emit("user_data_changed", [
+            {"username": name, "points": points, "bonus": bonus}
+            for name, points in credited
+        ])
+        return len(credited)
+
+    def start(self, socketio) -> None:
+        self._socketio = socketio
+        socketio.start_background_task(self._run)
+
+    def _run(self) -> None:
+        while True:
+            self._socketio.sleep(self.tick)
+            try:
+                self.run_once()
+            except Exception:
+                log.exception("Zuschau-Bonus fehlgeschlagen")
+
+    def stats(self) -> dict:
+        return {
+            "tick":     self.tick,
+            "runs":     self.runs,
+            "credited": self.credited,
+            "last_ms":  self.last_ms,
+        }
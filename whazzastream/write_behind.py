@@ -0,0 +1,245 @@
+# write_behind.py
+import logging
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import delete, func, insert, text
+from sqlalchemy.exc import DataError, IntegrityError
+
+from models import db, Message
+
+log = logging.getLogger(__name__)
+
+def last_message_id() -> int:
+    """Höchste je vergebene Nachrichten-id, auch nach TRUNCATE/Archivierung.
+
+    Auf MariaDB zählt AUTO_INCREMENT mit (``ChatArchiver.clear`` setzt es über
+    die alte höchste id, explizite ids aus dem Write-Behind ziehen es nach);
+    sonst bleibt nur MAX(id).
+    """
+    last = db.session.query(func.max(Message.id)).scalar() or 0
+    if db.engine.dialect.name in ("mysql", "mariadb"):
+        upcoming = db.session.execute(text(
+            "SELECT AUTO_INCREMENT FROM information_schema.TABLES "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'messages'")).scalar()
+        last = max(last, (upcoming or 1) - 1)
+    return last
+
+class BatchInserter:
+    """Sammelt Zeilen im Speicher und schreibt sie gebündelt per INSERT.
+
+    Scheitert ein Batch an einzelnen Zeilen (``IntegrityError``/``DataError``),
+    wird er halbiert, bis die schuldigen Zeilen isoliert sind; die landen
+    geloggt in ``dead_letters``, der Rest wird geschrieben. Bei anderen
+    DB-Fehlern bleiben die Zeilen in der Queue. Über ``max_queue`` Zeilen
+    werden neue verworfen und als ``overflow`` gezählt.
+    """
+
+    def __init__(self, app, model, interval: float = 0.25, batch_size: int = 200,
+                 max_queue: int = 100_000):
+        self.app        = app
+        self.model      = model
+        self.interval   = interval
+        self.batch_size = batch_size
+        self.max_queue  = max_queue
+
+        self._queue: deque[dict] = deque()
+        self._lock    = threading.Lock()
+        self._kicked  = False
+        self._socketio = None
+
+        self.dead_letters: deque[dict] = deque(maxlen=100)
+
+        self.max_depth     = 0
+        self.rows_written  = 0
+        self.batches       = 0
+        self.errors        = 0
+        self.dead          = 0
+        self.overflow      = 0
+        self.last_flush_ms = 0.0
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    def add(self, row: dict) -> None:
+        if len(self._queue) >= self.max_queue:
+            self.overflow += 1
+            if self.overflow % 1000 == 1:
+                log.error("Write-Behind: Queue für %s voll (%d) – Zeilen werden verworfen",
+                          self.model.__tablename__, self.max_queue)
+            return
+        self._queue.append(row)
+        depth = len(self._queue)
+        if depth > self.max_depth:
+            self.max_depth = depth
+        if depth >= self.batch_size and self._socketio and not self._kicked:
+            self._kicked = True
+            self._socketio.start_background_task(self.flush)
+
+    def discard(self, match=None) -> int:
+        """Verwirft wartende Zeilen – alle oder die, für die ``match(row)`` gilt.
+        Wartet einen laufenden Flush ab."""
+        with self._lock:
+            before = len(self._queue)
+            if match is None:
+                self._queue.clear()
+            else:
+                self._queue = deque(row for row in self._queue if not match(row))
+            return before - len(self._queue)
+
+    def _dead_letter(self, row: dict) -> None:
+        self.dead += 1
+        self.dead_letters.append(row)
+        log.error("Write-Behind: Zeile für %s verworfen: %r", self.model.__tablename__, row)
+
+    def _write(self, rows: list[dict]) -> tuple[int, int]:
+        """Schreibt ``rows``; liefert (geschrieben, verworfen). Bei anderen als
+        Zeilenfehlern kommt der noch offene Rest zurück an den Queue-Anfang."""
+        written = dead = 0
+        pending = [rows]             # Stapel – oben liegt, was als Nächstes dran ist
+        while pending:
+            part = pending.pop()
+            try:
+                db.session.execute(insert(self.model), part)
+                db.session.commit()
+                written += len(part)
+            except (IntegrityError, DataError):
+                db.session.rollback()
+                if len(part) == 1:
+                    self._dead_letter(part[0])
+                    dead += 1
+                else:
+                    mid = len(part) // 2
+                    pending += [part[mid:], part[:mid]]
+            except Exception:
+                db.session.rollback()
+                rest = [row for chunk in [part] + pending[::-1] for row in chunk]
+                self._queue.extendleft(reversed(rest))
+                self.errors += 1
+                log.exception("Write-Behind: %d Zeilen für %s nicht geschrieben",
+                              len(rest), self.model.__tablename__)
+                break
+        return written, dead
+
+    def flush(self) -> int:
+        """Schreibt einen Batch; liefert die Zahl erledigter (geschriebener
+        oder verworfener) Zeilen – 0 heißt: DB gerade nicht erreichbar."""
+        with self._lock:
+            self._kicked = False
+            rows = []
+            while self._queue and len(rows) < self.batch_size:
+                rows.append(self._queue.popleft())
+            if not rows:
+                return 0
+
+            started = time.perf_counter()
+            with self.app.app_context():
+                written, dead = self._write(rows)
+
+            if written:
+                self.rows_written += written
+                self.batches      += 1
+                self.last_flush_ms = round((time.perf_counter() - started) * 1000, 2)
+            return written + dead
+
+    def flush_all(self, retries: int = 3, pause: float = 0.5) -> None:
+        """Leert die Queue beim Herunterfahren; DB-Aussetzer werden ein paar
+        Mal abgewartet."""
+        while self._queue:
+            if self.flush():
+                continue
+            if retries <= 0:
+                log.error("Write-Behind: %d Zeilen für %s beim Beenden verloren",
+                          len(self._queue), self.model.__tablename__)
+                return
+            retries -= 1
+            time.sleep(pause)
+
+    def start(self, socketio) -> None:
+        self._socketio = socketio
+        socketio.start_background_task(self._run)
+
+    def _run(self) -> None:
+        while True:
+            self._socketio.sleep(self.interval)
+            while len(self._queue) and self.flush():
+                pass
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth":   self.depth,
+            "max_depth":     self.max_depth,
+            "rows_written":  self.rows_written,
+            "batches":       self.batches,
+            "errors":        self.errors,
+            "dead":          self.dead,
+            "overflow":      self.overflow,
+            "last_flush_ms": self.last_flush_ms,
+        }
+
+class MessageWriter:
+    """Persistiert Chatnachrichten – synchron oder (optional) per Write-Behind.
+
+    Im Write-Behind-Modus vergibt ein Zähler im Cluster-Store
+    (``store.next_id``) die IDs, damit die Nachricht sofort gebroadcastet
+    werden kann; der INSERT folgt gebündelt. Der Zähler ist für alle Worker
+    derselbe – die ids bleiben wie bei AUTO_INCREMENT in Sendereihenfolge,
+    worauf Historie und Scroll-Back bauen. Untergrenze ist
+    ``last_message_id()`` – ein geleerter Chat vergibt keine ids erneut.
+    """
+
+    def __init__(self, app, write_behind: bool = False,
+                 interval: float = 0.25, batch_size: int = 200, store=None):
+        self.write_behind = write_behind
+        self.store = store
+        self.queue = BatchInserter(app, Message, interval, batch_size)
+        self._floor = None
+        self._floor_lock = threading.Lock()
+
+    def _next_id(self) -> int:
+        if self._floor is None:
+            with self._floor_lock:
+                if self._floor is None:
+                    self._floor = last_message_id()
+        return self.store.next_id("messages", self._floor)
+
+    def save(self, **fields) -> int:
+        if not self.write_behind:
+            msg = Message(**fields)
+            db.session.add(msg)
+            db.session.commit()
+            return msg.id
+
+        msg_id = self._next_id()
+        self.queue.add({"id": msg_id, **fields})
+        return msg_id
+
+    def boundary(self) -> int:
+        """Größer als jede schon vergebene id (verbraucht im Write-Behind eine)."""
+        return self._next_id() if self.write_behind else 0
+
+    def discard(self, upto: int | None = None) -> None:
+        """Verwirft wartende Nachrichten. Mit ``upto`` (Clear auf einem anderen
+        Worker) nur die ids bis dahin – und löscht, was davon dieser Worker
+        nach dem TRUNCATE noch geschrieben hat."""
+        if upto is None:
+            self.queue.discard()
+            return
+        self.queue.discard(lambda row: row["id"] <= upto)
+        if self.write_behind:
+            with self.queue.app.app_context():
+                db.session.execute(delete(Message).where(Message.id <= upto))
+                db.session.commit()
+
+    def start(self, socketio) -> None:
+        if self.write_behind:
+            self.queue.start(socketio)
+
+    def close(self) -> None:
+        if self.write_behind:
+            self.queue.flush_all()
+
+    def stats(self) -> dict:
+        return {"write_behind": self.write_behind, **self.queue.stats()}